@@ -21,8 +21,58 @@ def create_app():
     app.config["APIFY_YOUTUBE_ACTOR_ID"] = os.getenv("APIFY_YOUTUBE_ACTOR_ID", "pintostudio~youtube-transcript")
     app.config["GEMINI_API_KEY"] = os.getenv("GEMINI_API_KEY", "")
     app.config["GEMINI_MODEL"] = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+    app.config["GUARDRAIL_CLASSIFIER_ENABLED"] = os.getenv("GUARDRAIL_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config["GUARDRAIL_CLASSIFIER_THRESHOLD"] = float(os.getenv("GUARDRAIL_CLASSIFIER_THRESHOLD", "0.9"))
+    app.config["GUARDRAIL_MODEL_PATH"] = os.getenv("GUARDRAIL_MODEL_PATH", "")
+    app.config["GUARDRAIL_MIN_CV_ACCURACY"] = float(os.getenv("GUARDRAIL_MIN_CV_ACCURACY", "0.85"))
+    app.config["CHAT_MEMORY_TURNS"] = int(os.getenv("CHAT_MEMORY_TURNS", "4"))
+    app.config["CHAT_MEMORY_TOKEN_BUDGET"] = int(os.getenv("CHAT_MEMORY_TOKEN_BUDGET", "1200"))
+    app.config["CHAT_ARCHIVE_AFTER_DAYS"] = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "180"))
+    app.config["DB_METRICS_ENABLED"] = os.getenv("DB_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config["SLOW_QUERY_MS"] = float(os.getenv("SLOW_QUERY_MS", "100"))
+    app.config["WRITE_QUEUE_ENABLED"] = os.getenv("WRITE_QUEUE_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config["WRITE_QUEUE_BATCH_MS"] = float(os.getenv("WRITE_QUEUE_BATCH_MS", "5"))
+    app.config["FILE_HASH_BACKFILL_ENABLED"] = os.getenv("FILE_HASH_BACKFILL_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config["FILE_HASH_BACKFILL_MAX_MBPS"] = float(os.getenv("FILE_HASH_BACKFILL_MAX_MBPS", "8"))
+    app.config["BLOB_STORE_DIR"] = os.getenv("BLOB_STORE_DIR", str(Path(app.root_path).parent / "data" / "blobs"))
+    app.config["LEGACY_UPLOAD_DIRS"] = [
+        str(Path(app.root_path).parent / "data" / "resources"),
+        str(Path(app.root_path).parent / "data" / "resumes"),
+    ]
+    app.config["STORAGE_GC_GRACE_HOURS"] = float(os.getenv("STORAGE_GC_GRACE_HOURS", "24"))
+    app.config["BLOB_ADOPTION_ENABLED"] = os.getenv("BLOB_ADOPTION_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config["MAX_RESOURCE_UPLOAD_BYTES"] = int(os.getenv("MAX_RESOURCE_UPLOAD_MB", "50")) * 1024 * 1024
+    # Refuse oversized bodies before werkzeug spools them; 1 MB covers multipart framing and form fields.
+    app.config["MAX_CONTENT_LENGTH"] = app.config["MAX_RESOURCE_UPLOAD_BYTES"] + 1024 * 1024
+    app.config["NEAR_DUPLICATE_THRESHOLD"] = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+    app.config["RELATED_RESOURCES_TOP_K"] = int(os.getenv("RELATED_RESOURCES_TOP_K", "10"))
+    app.config["RESOURCE_STATS_ENABLED"] = os.getenv("RESOURCE_STATS_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config["RESOURCE_STATS_FLUSH_SECONDS"] = float(os.getenv("RESOURCE_STATS_FLUSH_SECONDS", "5"))
+    app.config["RESOURCE_BUNDLE_MAX_FILES"] = int(os.getenv("RESOURCE_BUNDLE_MAX_FILES", "100"))
+    app.config["FILE_ACCEL_MODE"] = os.getenv("FILE_ACCEL_MODE", "").lower()
+    app.config["FILE_ACCEL_PREFIX"] = os.getenv("FILE_ACCEL_PREFIX", "/_blobs/")
+    app.config["USE_X_SENDFILE"] = app.config["FILE_ACCEL_MODE"] == "sendfile"
 
     init_db(app)
+    if app.config["WRITE_QUEUE_ENABLED"]:
+        from .write_queue import start_write_queue
+        start_write_queue(app.config["DATABASE"], batch_window_ms=app.config["WRITE_QUEUE_BATCH_MS"])
+    if app.config["RESOURCE_STATS_ENABLED"]:
+        from .resource_stats import start_resource_stats
+        start_resource_stats(app.config["DATABASE"], flush_interval_s=app.config["RESOURCE_STATS_FLUSH_SECONDS"])
+    if app.config["FILE_HASH_BACKFILL_ENABLED"]:
+        from .background_jobs import start_file_hash_backfill
+        start_file_hash_backfill(
+            app.config["DATABASE"],
+            max_bytes_per_sec=app.config["FILE_HASH_BACKFILL_MAX_MBPS"] * 1024 * 1024,
+        )
+    if app.config["BLOB_ADOPTION_ENABLED"]:
+        from .background_jobs import start_blob_adoption
+        start_blob_adoption(
+            app.config["DATABASE"],
+            app.config["BLOB_STORE_DIR"],
+            max_bytes_per_sec=app.config["FILE_HASH_BACKFILL_MAX_MBPS"] * 1024 * 1024,
+        )
     
     # Initialize RAG pipeline with knowledge base
     with app.app_context():
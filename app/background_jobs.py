@@ -0,0 +1,240 @@
+"""
+Background Jobs - Resumable one-shot maintenance jobs
+
+Jobs record their progress in the background_jobs table (status, cursor,
+counters, last error) so they can be stopped at any point and resume where
+they left off. A job is claimed with a lease: a worker only starts it if it is
+not finished and nobody else has touched it recently, so several app workers
+starting together run it once.
+
+Jobs:
+    file_hash_backfill         hash legacy resources that predate file_hash, in id
+                               order, with chunked and rate-limited reads.
+    blob_adoption:<table>      move legacy per-user resource/resume files into the
+                               content-addressed blob store (hard link, then
+                               repoint file_path and drop the old name).
+
+Offline: python scripts/backfill_file_hashes.py
+"""
+import logging
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from .db import get_connection
+from .migrations import BLOB_REFERENCING_TABLES
+from .storage import adopt_file, hash_file, is_blob_path
+
+logger = logging.getLogger(__name__)
+
+FILE_HASH_BACKFILL = "file_hash_backfill"
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_BYTES_PER_SEC = 8 * 1024 * 1024
+# A running job that has not reported progress for this long is considered abandoned.
+LEASE_TIMEOUT = "-5 minutes"
+
+
+def get_job(db_path: str, name: str) -> Optional[Dict]:
+    with get_connection(db_path) as conn:
+        row = conn.execute("SELECT * FROM background_jobs WHERE name = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+
+def _claim_job(db_path: str, name: str) -> bool:
+    with get_connection(db_path) as conn:
+        conn.execute("INSERT OR IGNORE INTO background_jobs (name) VALUES (?)", (name,))
+        cur = conn.execute(
+            """
+            UPDATE background_jobs
+            SET status = 'running',
+                started_at = COALESCE(started_at, datetime('now')),
+                updated_at = datetime('now')
+            WHERE name = ?
+              AND status != 'done'
+              AND (status != 'running' OR updated_at < datetime('now', ?))
+            """,
+            (name, LEASE_TIMEOUT),
+        )
+        conn.commit()
+        return cur.rowcount == 1
+
+
+def _save_progress(db_path: str, name: str, cursor: int, processed: int, failed: int,
+                   status: str = "running", error: Optional[str] = None):
+    with get_connection(db_path) as conn:
+        conn.execute(
+            """
+            UPDATE background_jobs
+            SET status = ?, cursor = ?, processed = processed + ?, failed = failed + ?,
+                last_error = COALESCE(?, last_error),
+                updated_at = datetime('now'),
+                finished_at = CASE WHEN ? = 'done' THEN datetime('now') ELSE finished_at END
+            WHERE name = ?
+            """,
+            (status, cursor, processed, failed, error, status, name),
+        )
+        conn.commit()
+
+
+def run_file_hash_backfill(db_path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                           max_bytes_per_sec: Optional[float] = DEFAULT_MAX_BYTES_PER_SEC,
+                           should_stop: Optional[Callable[[], bool]] = None) -> Optional[Dict]:
+    """
+    Fill in file_hash/file_size for legacy resources, resuming from the saved
+    cursor. Returns the final job row, or None if another worker holds the job.
+    """
+    if not _claim_job(db_path, FILE_HASH_BACKFILL):
+        return None
+    cursor = (get_job(db_path, FILE_HASH_BACKFILL) or {}).get("cursor", 0)
+    logger.info(f"File hash backfill resuming after resource id {cursor}")
+
+    while True:
+        if should_stop and should_stop():
+            _save_progress(db_path, FILE_HASH_BACKFILL, cursor, 0, 0, status="paused")
+            break
+        with get_connection(db_path) as conn:
+            rows = conn.execute(
+                """
+                SELECT id, file_path FROM resources
+                WHERE id > ? AND (file_hash IS NULL OR file_hash = '')
+                ORDER BY id
+                LIMIT ?
+                """,
+                (cursor, batch_size),
+            ).fetchall()
+        if not rows:
+            _save_progress(db_path, FILE_HASH_BACKFILL, cursor, 0, 0, status="done")
+            break
+
+        processed, failed, error = 0, 0, None
+        for row in rows:
+            try:
+                file_hash, file_size = hash_file(row["file_path"], max_bytes_per_sec=max_bytes_per_sec)
+                with get_connection(db_path) as conn:
+                    conn.execute(
+                        "UPDATE resources SET file_hash = ?, file_size = ? WHERE id = ?",
+                        (file_hash, file_size, row["id"]),
+                    )
+                    conn.commit()
+                processed += 1
+            except OSError as e:
+                # Missing or unreadable file; leave the row unhashed and move on.
+                failed += 1
+                error = f"resource {row['id']}: {e}"
+            cursor = row["id"]
+        _save_progress(db_path, FILE_HASH_BACKFILL, cursor, processed, failed, error=error)
+
+    job = get_job(db_path, FILE_HASH_BACKFILL)
+    logger.info(f"File hash backfill {job['status']}: {job['processed']} hashed, {job['failed']} failed")
+    return job
+
+
+def _legacy_path_in_use(conn, path: str) -> bool:
+    for table in BLOB_REFERENCING_TABLES:
+        if conn.execute(f"SELECT 1 FROM {table} WHERE file_path = ? LIMIT 1", (path,)).fetchone():
+            return True
+    return False
+
+
+def run_blob_adoption(db_path: str, table: str, blob_dir: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                      max_bytes_per_sec: Optional[float] = DEFAULT_MAX_BYTES_PER_SEC,
+                      should_stop: Optional[Callable[[], bool]] = None) -> Optional[Dict]:
+    """
+    Adopt `table`'s legacy files into the blob store, resuming from the saved
+    cursor. Each file is re-hashed: a per-user path may have been overwritten
+    by a later upload of the same name, so the bytes on disk win over the
+    recorded hash. Returns the final job row, or None if another worker holds the job.
+    """
+    if table not in BLOB_REFERENCING_TABLES:
+        raise ValueError(f"{table} does not reference blobs")
+    name = f"blob_adoption:{table}"
+    if not _claim_job(db_path, name):
+        return None
+    cursor = (get_job(db_path, name) or {}).get("cursor", 0)
+    logger.info(f"Blob adoption for {table} resuming after id {cursor}")
+
+    while True:
+        if should_stop and should_stop():
+            _save_progress(db_path, name, cursor, 0, 0, status="paused")
+            break
+        with get_connection(db_path) as conn:
+            rows = conn.execute(
+                f"SELECT id, file_path, file_hash FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                (cursor, batch_size),
+            ).fetchall()
+        if not rows:
+            _save_progress(db_path, name, cursor, 0, 0, status="done")
+            break
+
+        processed, failed, error = 0, 0, None
+        for row in rows:
+            cursor = row["id"]
+            legacy_path = row["file_path"]
+            if is_blob_path(blob_dir, legacy_path):
+                continue
+            try:
+                file_hash, file_size = hash_file(legacy_path, max_bytes_per_sec=max_bytes_per_sec)
+                blob = adopt_file(legacy_path, blob_dir, file_hash)
+            except OSError as e:
+                failed += 1
+                error = f"{table} {row['id']}: {e}"
+                continue
+            if row["file_hash"] and row["file_hash"] != file_hash:
+                logger.warning(f"{table} {row['id']}: file on disk no longer matches recorded hash; using disk")
+            with get_connection(db_path) as conn:
+                conn.execute(
+                    f"UPDATE {table} SET file_path = ?, file_hash = ?, file_size = ? WHERE id = ? AND file_path = ?",
+                    (str(blob), file_hash, file_size, row["id"], legacy_path),
+                )
+                conn.commit()
+                in_use = _legacy_path_in_use(conn, legacy_path)
+            if not in_use:
+                # The blob is a hard link (or copy) of this file, so only the old name goes.
+                try:
+                    os.unlink(legacy_path)
+                except OSError:
+                    pass
+            processed += 1
+        _save_progress(db_path, name, cursor, processed, failed, error=error)
+
+    job = get_job(db_path, name)
+    logger.info(f"Blob adoption for {table} {job['status']}: {job['processed']} adopted, {job['failed']} failed")
+    return job
+
+
+def start_file_hash_backfill(db_path: str, **kwargs) -> Optional[threading.Thread]:
+    """Run the backfill on a daemon thread unless it has already finished."""
+    job = get_job(db_path, FILE_HASH_BACKFILL)
+    if job and job["status"] == "done":
+        return None
+
+    def _run():
+        try:
+            run_file_hash_backfill(db_path, **kwargs)
+        except Exception as e:
+            logger.error(f"File hash backfill failed: {str(e)}")
+
+    thread = threading.Thread(target=_run, name="file-hash-backfill", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_blob_adoption(db_path: str, blob_dir: str, **kwargs) -> Optional[threading.Thread]:
+    """Adopt legacy files for every blob-referencing table on a daemon thread."""
+    tables = [
+        table for table in BLOB_REFERENCING_TABLES
+        if (get_job(db_path, f"blob_adoption:{table}") or {}).get("status") != "done"
+    ]
+    if not tables:
+        return None
+
+    def _run():
+        for table in tables:
+            try:
+                run_blob_adoption(db_path, table, blob_dir, **kwargs)
+            except Exception as e:
+                logger.error(f"Blob adoption for {table} failed: {str(e)}")
+
+    thread = threading.Thread(target=_run, name="blob-adoption", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,219 @@
+"""
+Chat Archive - Cold storage for old chat history
+
+Turns older than CHAT_ARCHIVE_AFTER_DAYS are moved out of chat_history into
+one compressed blob per user per month (chat_archive). The hot table and its
+indexes stay small, so chat writes and recent-history reads keep hitting the
+page cache. Archived turns remain readable: history paging falls through to
+the archive once the hot rows run out, and exports iterate both.
+
+Blobs are zstd-compressed when the optional `zstandard` package is installed
+and zlib-compressed otherwise; the codec is stored per row so either can be
+read back.
+
+Run the job with: python scripts/archive_chat_history.py --days 180
+"""
+import json
+import logging
+import zlib
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+
+from .db import get_connection, open_connection
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+
+
+def _compress(data: bytes):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def _decompress(codec: str, payload: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this chat archive")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown chat archive codec: {codec}")
+
+
+def _decode_rows(codec: str, payload: bytes) -> List[Dict[str, Any]]:
+    return json.loads(_decompress(codec, payload).decode("utf-8"))
+
+
+def _month_bounds(month: str):
+    year, mon = (int(part) for part in month.split("-"))
+    start = date(year, mon, 1)
+    end = date(year + (mon == 12), mon % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def archive_chat_history(db_path: str, older_than_days: int = DEFAULT_ARCHIVE_AFTER_DAYS) -> Dict[str, int]:
+    """
+    Move turns older than `older_than_days` into per-user monthly blobs.
+    Safe to re-run: turns landing in an already archived month are merged
+    into the existing blob. Each (user, month) moves in its own transaction.
+    """
+    with get_connection(db_path) as conn:
+        cutoff = conn.execute(
+            "SELECT datetime('now', ?)", (f"-{int(older_than_days)} days",)
+        ).fetchone()[0]
+        groups = conn.execute(
+            """
+            SELECT email, substr(created_at, 1, 7) AS month
+            FROM chat_history
+            WHERE created_at < ?
+            GROUP BY email, month
+            """,
+            (cutoff,),
+        ).fetchall()
+    stats = {"groups": 0, "rows": 0}
+    for group in groups:
+        moved = _archive_month(db_path, group["email"], group["month"], cutoff)
+        stats["groups"] += 1
+        stats["rows"] += moved
+    logger.info(f"Archived {stats['rows']} chat turns in {stats['groups']} user-months (cutoff {cutoff})")
+    return stats
+
+
+def _archive_month(db_path: str, email: str, month: str, cutoff: str) -> int:
+    month_start, month_end = _month_bounds(month)
+    upper = min(month_end, cutoff)
+    conn = open_connection(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            """
+            SELECT c.id, c.user_message, c.assistant_response,
+                   COALESCE(x.content, c.context) AS context, c.created_at
+            FROM chat_history c
+            LEFT JOIN chat_contexts x ON x.hash = c.context_hash
+            WHERE c.email = ? AND c.created_at >= ? AND c.created_at < ?
+            ORDER BY c.created_at, c.id
+            """,
+            (email, month_start, upper),
+        ).fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+
+        merged = {row["id"]: dict(row) for row in rows}
+        existing = conn.execute(
+            "SELECT codec, payload FROM chat_archive WHERE email = ? AND month = ?",
+            (email, month),
+        ).fetchone()
+        if existing:
+            for row in _decode_rows(existing["codec"], existing["payload"]):
+                merged.setdefault(row["id"], row)
+        archived = sorted(merged.values(), key=lambda r: (r["created_at"], r["id"]))
+
+        codec, payload = _compress(
+            json.dumps(archived, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        )
+        conn.execute(
+            """
+            INSERT INTO chat_archive (email, month, codec, payload, row_count,
+                                      first_id, last_id, first_ts, last_ts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(email, month) DO UPDATE SET
+                codec = excluded.codec,
+                payload = excluded.payload,
+                row_count = excluded.row_count,
+                first_id = excluded.first_id,
+                last_id = excluded.last_id,
+                first_ts = excluded.first_ts,
+                last_ts = excluded.last_ts,
+                updated_at = excluded.updated_at
+            """,
+            (
+                email, month, codec, payload, len(archived),
+                min(r["id"] for r in archived), max(r["id"] for r in archived),
+                archived[0]["created_at"], archived[-1]["created_at"],
+            ),
+        )
+        conn.execute(
+            "DELETE FROM chat_history WHERE email = ? AND created_at >= ? AND created_at < ?",
+            (email, month_start, upper),
+        )
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _shape_row(row: Dict[str, Any], include_context: bool) -> Dict[str, Any]:
+    shaped = {
+        "id": row["id"],
+        "user_message": row["user_message"],
+        "assistant_response": row["assistant_response"],
+        "context_hash": None,
+        "created_at": row["created_at"],
+        "archived": True,
+    }
+    if include_context:
+        shaped["context"] = row.get("context")
+    return shaped
+
+
+def get_archived_chat_page(db_path: str, email: str, before_ts: Optional[str] = None,
+                           before_id: Optional[int] = None, limit: int = 20,
+                           include_context: bool = False) -> List[Dict[str, Any]]:
+    """
+    Archived turns strictly older than (before_ts, before_id), most recent first.
+    Same ordering and cursor semantics as get_chat_history_page, so callers can
+    continue paging from the hot table straight into the archive.
+    """
+    results: List[Dict[str, Any]] = []
+    with get_connection(db_path) as conn:
+        if before_ts is not None:
+            blobs = conn.execute(
+                """
+                SELECT codec, payload FROM chat_archive
+                WHERE email = ? AND first_ts <= ?
+                ORDER BY month DESC
+                """,
+                (email, before_ts),
+            )
+        else:
+            blobs = conn.execute(
+                "SELECT codec, payload FROM chat_archive WHERE email = ? ORDER BY month DESC",
+                (email,),
+            )
+        for blob in blobs:
+            for row in reversed(_decode_rows(blob["codec"], blob["payload"])):
+                if before_ts is not None and (row["created_at"], row["id"]) >= (before_ts, before_id or 0):
+                    continue
+                results.append(_shape_row(row, include_context))
+                if len(results) >= limit:
+                    return results
+    return results
+
+
+def iter_archived_chat_rows(db_path: str, email: str) -> Iterator[Dict[str, Any]]:
+    """Yield every archived turn for a user in chronological order, one month at a time."""
+    with get_connection(db_path) as conn:
+        months = conn.execute(
+            "SELECT month FROM chat_archive WHERE email = ? ORDER BY month", (email,)
+        ).fetchall()
+    for month in months:
+        with get_connection(db_path) as conn:
+            blob = conn.execute(
+                "SELECT codec, payload FROM chat_archive WHERE email = ? AND month = ?",
+                (email, month["month"]),
+            ).fetchone()
+        if blob:
+            for row in _decode_rows(blob["codec"], blob["payload"]):
+                yield _shape_row(row, include_context=True)
@@ -0,0 +1,134 @@
+"""
+Data Export - Streaming NDJSON export of a user's data
+
+Rows are read through a dedicated SQLite cursor in small batches and written
+out as one JSON object per line, so memory stays flat however much history a
+user has. The output can optionally be gzip-compressed on the fly.
+
+Line format: {"type": "<section>", "data": {...}}
+"""
+import json
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+from .chat_archive import iter_archived_chat_rows
+from .db import open_connection
+
+EXPORT_SECTIONS = ("chat_history", "mock_tests", "habits", "resumes")
+FETCH_BATCH_SIZE = 500
+
+
+def _iter_query(conn, sql: str, params: tuple) -> Iterator[dict]:
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(row)
+
+
+def _iter_chat_history(conn, db_path: str, email: str) -> Iterator[dict]:
+    # Archived months hold the oldest turns, so they come first.
+    for row in iter_archived_chat_rows(db_path, email):
+        row.pop("context_hash", None)
+        yield row
+    yield from _iter_query(
+        conn,
+        """
+        SELECT c.id, c.user_message, c.assistant_response,
+               COALESCE(x.content, c.context) AS context, c.created_at
+        FROM chat_history c
+        LEFT JOIN chat_contexts x ON x.hash = c.context_hash
+        WHERE c.email = ?
+        ORDER BY c.created_at, c.id
+        """,
+        (email,),
+    )
+
+
+def _iter_mock_tests(conn, db_path: str, email: str) -> Iterator[dict]:
+    yield from _iter_query(
+        conn,
+        """
+        SELECT id, test_name, source, score, max_score, date_taken, notes, created_at, updated_at
+        FROM mock_tests
+        WHERE email = ?
+        ORDER BY date_taken, id
+        """,
+        (email,),
+    )
+
+
+def _iter_habits(conn, db_path: str, email: str) -> Iterator[dict]:
+    habits = _iter_query(
+        conn,
+        "SELECT id, name, color, position, created_at FROM habits WHERE email = ? ORDER BY position",
+        (email,),
+    )
+    for habit in habits:
+        yield {"kind": "habit", **habit}
+    yield from (
+        {"kind": "habit_log", **log}
+        for log in _iter_query(
+            conn,
+            """
+            SELECT habit_id, log_date, done
+            FROM habit_logs
+            WHERE email = ?
+            ORDER BY log_date, habit_id
+            """,
+            (email,),
+        )
+    )
+
+
+def _iter_resumes(conn, db_path: str, email: str) -> Iterator[dict]:
+    # Metadata only; the uploaded file and extracted text are not exported.
+    yield from _iter_query(
+        conn,
+        """
+        SELECT id, filename, ats_score, created_at, updated_at
+        FROM resumes
+        WHERE email = ?
+        ORDER BY created_at, id
+        """,
+        (email,),
+    )
+
+
+_SECTION_READERS = {
+    "chat_history": _iter_chat_history,
+    "mock_tests": _iter_mock_tests,
+    "habits": _iter_habits,
+    "resumes": _iter_resumes,
+}
+
+
+def iter_user_export(db_path: str, email: str, sections: Optional[Iterable[str]] = None) -> Iterator[bytes]:
+    """Yield NDJSON lines (bytes) for the requested sections of a user's data."""
+    sections: List[str] = list(sections or EXPORT_SECTIONS)
+    # Dedicated connection: the generator outlives the request that started it.
+    conn = open_connection(db_path)
+    try:
+        for section in sections:
+            for row in _SECTION_READERS[section](conn, db_path, email):
+                line = json.dumps({"type": section, "data": row}, ensure_ascii=False, default=str)
+                yield (line + "\n").encode("utf-8")
+    finally:
+        conn.close()
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6, min_flush: int = 64 * 1024) -> Iterator[bytes]:
+    """Gzip-compress a byte stream incrementally, emitting output roughly every `min_flush` input bytes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    pending = 0
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= min_flush:
+            out += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if out:
+            yield out
+    yield compressor.flush()
@@ -1,201 +1,144 @@
+import os
+import re
+import sys
 import sqlite3
 import hashlib
+import time
 from pathlib import Path
+from queue import Full
+
+from flask import g, has_request_context
+
+from . import db_metrics, write_queue
+
+# Per-connection tuning applied to every connection handed out below.
+# journal_mode=WAL is persistent in the database file and is set once in init_db.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_CACHED_STATEMENTS = 256
 
 
 def init_db(app):
-    """Create necessary tables in the SQLite database."""
+    """Bring the SQLite database schema up to date (see app/migrations.py)."""
+    from .migrations import ensure_schema
+
     db_path = Path(app.config["DATABASE"])
     db_path.parent.mkdir(parents=True, exist_ok=True)
+    app.teardown_appcontext(close_request_connections)
+    db_metrics.configure(
+        enabled=app.config.get("DB_METRICS_ENABLED", True),
+        slow_query_ms=app.config.get("SLOW_QUERY_MS", 100),
+    )
 
-    with sqlite3.connect(db_path) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS first_login (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL UNIQUE,
-                completed INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS onboarding_responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL UNIQUE,
-                department TEXT NOT NULL,
-                problem_solving INTEGER NOT NULL,
-                resume_ready INTEGER NOT NULL,
-                interview_ready INTEGER NOT NULL,
-                consistency INTEGER NOT NULL,
-                overall_score REAL NOT NULL,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS skill_checklists (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL UNIQUE,
-                data TEXT NOT NULL,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS mock_tests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL,
-                test_name TEXT NOT NULL,
-                source TEXT NOT NULL,
-                score REAL NOT NULL,
-                max_score REAL NOT NULL,
-                date_taken TEXT NOT NULL,
-                notes TEXT,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS resumes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL,
-                filename TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                file_content TEXT,
-                analysis_data TEXT,
-                ats_score REAL,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS habits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL,
-                name TEXT NOT NULL,
-                color TEXT NOT NULL DEFAULT '#FF6B35',
-                position INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS habit_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                habit_id INTEGER NOT NULL,
-                email TEXT NOT NULL,
-                log_date TEXT NOT NULL,
-                done INTEGER NOT NULL DEFAULT 0,
-                UNIQUE(habit_id, log_date),
-                FOREIGN KEY (habit_id) REFERENCES habits(id) ON DELETE CASCADE
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS chat_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL,
-                user_message TEXT NOT NULL,
-                assistant_response TEXT NOT NULL,
-                context TEXT,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS resources (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL,
-                uploader_name TEXT NOT NULL,
-                title TEXT NOT NULL,
-                subject TEXT NOT NULL,
-                branch TEXT NOT NULL,
-                year_of_engineering TEXT NOT NULL,
-                academic_year TEXT NOT NULL,
-                description TEXT,
-                filename TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                file_hash TEXT,
-                file_size INTEGER,
-                status TEXT NOT NULL DEFAULT 'pending',
-                uploaded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                reviewed_at TEXT,
-                reviewed_by TEXT
-            )
-            """
-        )
-        # Backfill schema for existing databases.
-        res_columns = {
-            row[1] for row in conn.execute("PRAGMA table_info(resources)").fetchall()
-        }
-        if "file_hash" not in res_columns:
-            conn.execute("ALTER TABLE resources ADD COLUMN file_hash TEXT")
-        if "file_size" not in res_columns:
-            conn.execute("ALTER TABLE resources ADD COLUMN file_size INTEGER")
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_resources_file_hash ON resources(file_hash)"
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS resource_comments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                resource_id INTEGER NOT NULL,
-                commenter_email TEXT NOT NULL,
-                commenter_name TEXT NOT NULL,
-                comment TEXT NOT NULL,
-                is_admin INTEGER NOT NULL DEFAULT 0,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS ai_refinements (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                resource_id INTEGER NOT NULL,
-                user_email TEXT NOT NULL,
-                summary TEXT,
-                questions_data TEXT,
-                status TEXT NOT NULL DEFAULT 'pending',
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                completed_at TEXT,
-                FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
-            )
-            """
-        )
-        conn.commit()
-def get_connection(db_path):
-    """Return a sqlite3 connection with Row factory."""
-    conn = sqlite3.connect(db_path)
+    with open_connection(str(db_path)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+    ensure_schema(str(db_path))
+
+
+class _ManagedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection whose context manager also closes it, unless it is the
+    request-scoped connection (closed on app-context teardown instead).
+    Statements run through execute()/executemany() are timed by db_metrics.
+    """
+
+    request_scoped = False
+
+    def execute(self, sql, parameters=()):
+        if not db_metrics.is_enabled():
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            db_metrics.record(sql, parameters, time.perf_counter() - start, sys._getframe(1))
+
+    def executemany(self, sql, seq_of_parameters):
+        if not db_metrics.is_enabled():
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            db_metrics.record(sql, (), time.perf_counter() - start, sys._getframe(1))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        result = super().__exit__(exc_type, exc_value, traceback)
+        if not self.request_scoped:
+            self.close()
+        return result
+
+
+def open_connection(db_path):
+    """Open a dedicated, tuned connection with Row factory. Closed when its `with` block exits."""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        factory=_ManagedConnection,
+        cached_statements=SQLITE_CACHED_STATEMENTS,
+    )
     conn.row_factory = sqlite3.Row
+    # executescript bypasses the timed execute() so setup does not skew db_metrics.
+    conn.executescript(
+        f"""
+        PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS};
+        PRAGMA synchronous = NORMAL;
+        PRAGMA foreign_keys = ON;
+        PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB};
+        PRAGMA mmap_size = {SQLITE_MMAP_SIZE};
+        """
+    )
     return conn
 
 
+def get_connection(db_path):
+    """
+    Return a sqlite3 connection with Row factory.
+    Inside a request the same connection is reused by every helper and closed
+    on teardown; elsewhere each call gets a dedicated connection.
+    """
+    if not has_request_context():
+        return open_connection(db_path)
+    connections = g.setdefault("_db_connections", {})
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = open_connection(db_path)
+        conn.request_scoped = True
+        connections[db_path] = conn
+    return conn
+
+
+def close_request_connections(exc=None):
+    """Teardown hook: roll back anything left uncommitted and close request connections."""
+    connections = g.pop("_db_connections", None) or {}
+    for conn in connections.values():
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            conn.close()
+
+
+def _queued_write(db_path, tx, *args):
+    """
+    Run `tx(conn, *args)` through the group-commit writer when one is running
+    for this database (returns once the batch commits); otherwise, or when the
+    writer is stopped or backed up past its submit timeout, write directly.
+    """
+    queue = write_queue.get_write_queue(db_path)
+    if queue is not None and queue.is_alive():
+        try:
+            return queue.submit(tx, *args).result(timeout=write_queue.RESULT_TIMEOUT_S)
+        except (write_queue.WriteQueueStopped, Full):
+            # Never attempted by the writer, so writing directly cannot apply it twice.
+            pass
+    with get_connection(db_path) as conn:
+        result = tx(conn, *args)
+        conn.commit()
+        return result
+
+
 def get_user_by_email(db_path, email):
     with get_connection(db_path) as conn:
         cur = conn.execute("SELECT * FROM users WHERE email = ?", (email,))
@@ -226,13 +169,15 @@ def get_first_login_record(db_path, email):
         return cur.fetchone()
 
 
+def _ensure_first_login_record_tx(conn, email):
+    conn.execute(
+        "INSERT OR IGNORE INTO first_login (email, completed) VALUES (?, 0)",
+        (email,),
+    )
+
+
 def ensure_first_login_record(db_path, email):
-    with get_connection(db_path) as conn:
-        conn.execute(
-            "INSERT OR IGNORE INTO first_login (email, completed) VALUES (?, 0)",
-            (email,),
-        )
-        conn.commit()
+    _queued_write(db_path, _ensure_first_login_record_tx, email)
 
 
 def set_first_login_completed(db_path, email):
@@ -287,16 +232,18 @@ def get_skill_checklist(db_path, email):
         return row["data"] if row else None
 
 
+def _save_skill_checklist_tx(conn, email, data):
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO skill_checklists (email, data, updated_at)
+        VALUES (?, ?, datetime('now'))
+        """,
+        (email, data),
+    )
+
+
 def save_skill_checklist(db_path, email, data):
-    with get_connection(db_path) as conn:
-        conn.execute(
-            """
-            INSERT OR REPLACE INTO skill_checklists (email, data, updated_at)
-            VALUES (?, ?, datetime('now'))
-            """,
-            (email, data),
-        )
-        conn.commit()
+    _queued_write(db_path, _save_skill_checklist_tx, email, data)
 
 
 def create_mock_test(db_path, email, test_name, source, score, max_score, date_taken, notes):
@@ -356,14 +303,14 @@ def delete_mock_test(db_path, test_id, email):
         return cur.rowcount
 
 
-def save_resume(db_path, email, filename, file_path, file_content):
+def save_resume(db_path, email, filename, file_path, file_content, file_hash=None, file_size=None):
     with get_connection(db_path) as conn:
         cur = conn.execute(
             """
-            INSERT INTO resumes (email, filename, file_path, file_content)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO resumes (email, filename, file_path, file_content, file_hash, file_size)
+            VALUES (?, ?, ?, ?, ?, ?)
             """,
-            (email, filename, file_path, file_content),
+            (email, filename, file_path, file_content, file_hash, file_size),
         )
         conn.commit()
         return cur.lastrowid
@@ -474,31 +421,41 @@ def delete_habit(db_path, habit_id, email):
         return 1
 
 
+def _toggle_habit_log_tx(conn, habit_id, email, log_date, done):
+    # Checked first: with foreign keys on, an unknown habit_id would raise IntegrityError.
+    owned = conn.execute("SELECT 1 FROM habits WHERE id = ? AND email = ?", (habit_id, email)).fetchone()
+    if not owned:
+        return False
+    conn.execute(
+        """
+        INSERT INTO habit_logs (habit_id, email, log_date, done)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(habit_id, log_date) DO UPDATE SET done = excluded.done
+        """,
+        (habit_id, email, log_date, done),
+    )
+    return True
+
+
 def toggle_habit_log(db_path, habit_id, email, log_date, done):
-    with get_connection(db_path) as conn:
-        conn.execute(
-            """
-            INSERT INTO habit_logs (habit_id, email, log_date, done)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(habit_id, log_date) DO UPDATE SET done = excluded.done
-            """,
-            (habit_id, email, log_date, done),
-        )
-        conn.commit()
+    """Set a day's log for one of the user's habits. Returns False if the habit is not theirs."""
+    return _queued_write(db_path, _toggle_habit_log_tx, habit_id, email, log_date, done)
 
 
 def get_habit_logs(db_path, email, year, month):
     with get_connection(db_path) as conn:
-        prefix = f"{year:04d}-{month:02d}"
+        # Half-open date range so the (email, log_date) index is usable.
+        start = f"{year:04d}-{month:02d}-01"
+        end = f"{year + (month == 12):04d}-{month % 12 + 1:02d}-01"
         cur = conn.execute(
             """
             SELECT hl.habit_id, hl.log_date, hl.done
             FROM habit_logs hl
             JOIN habits h ON h.id = hl.habit_id
-            WHERE hl.email = ? AND hl.log_date LIKE ?
+            WHERE hl.email = ? AND hl.log_date >= ? AND hl.log_date < ?
             ORDER BY hl.log_date
             """,
-            (email, f"{prefix}%"),
+            (email, start, end),
         )
         return cur.fetchall()
 
@@ -521,6 +478,16 @@ def get_leaderboard(db_path):
         )
         rows = cur.fetchall()
 
+        # Get display names
+        cur = conn.execute("SELECT email, full_name FROM users")
+        name_map = {r["email"]: r["full_name"] for r in cur.fetchall()}
+
+        # Get habit counts per user
+        cur = conn.execute(
+            "SELECT email, COUNT(*) as cnt FROM habits GROUP BY email"
+        )
+        habit_counts = {r["email"]: r["cnt"] for r in cur.fetchall()}
+
     from datetime import datetime, timedelta
 
     # Group dates by user
@@ -531,18 +498,6 @@ def get_leaderboard(db_path):
             user_dates[email] = []
         user_dates[email].append(row["log_date"])
 
-    # Get display names
-    with get_connection(db_path) as conn:
-        cur = conn.execute("SELECT email, full_name FROM users")
-        name_map = {r["email"]: r["full_name"] for r in cur.fetchall()}
-
-    # Get habit counts per user
-    with get_connection(db_path) as conn:
-        cur = conn.execute(
-            "SELECT email, COUNT(*) as cnt FROM habits GROUP BY email"
-        )
-        habit_counts = {r["email"]: r["cnt"] for r in cur.fetchall()}
-
     today_str = datetime.now().strftime("%Y-%m-%d")
     results = []
 
@@ -618,20 +573,13 @@ def admin_get_all_users(db_path):
 
 def admin_get_user_details(db_path, email):
     """Return everything about a single user."""
-    with get_connection(db_path) as conn:
-        cur = conn.execute("SELECT * FROM users WHERE email = ?", (email,))
-        user = dict(cur.fetchone()) if cur.fetchone() is None else None
-
-    # re-fetch properly
     with get_connection(db_path) as conn:
         cur = conn.execute("SELECT id, full_name, email, created_at FROM users WHERE email = ?", (email,))
         row = cur.fetchone()
-        user = dict(row) if row else None
-
-    if not user:
-        return None
+        if not row:
+            return None
+        user = dict(row)
 
-    with get_connection(db_path) as conn:
         cur = conn.execute("SELECT * FROM onboarding_responses WHERE email = ?", (email,))
         row = cur.fetchone()
         onboarding = dict(row) if row else None
@@ -726,6 +674,40 @@ def admin_delete_user(db_path, email):
         conn.commit()
 
 
+def get_storage_usage(db_path, email=None, top=20):
+    """
+    Storage totals kept by the storage_usage triggers: site-wide totals, the
+    `top` users by bytes uploaded and, when email is given, that user's row.
+    """
+    columns = "owner, resource_count, resource_bytes, resume_count, resume_bytes, updated_at"
+    with get_connection(db_path) as conn:
+        totals = conn.execute(
+            f"SELECT {columns}, blob_count, blob_bytes FROM storage_usage WHERE owner = '*'"
+        ).fetchone()
+        cur = conn.execute(
+            f"""
+            SELECT {columns}, resource_bytes + resume_bytes AS total_bytes
+            FROM storage_usage
+            WHERE owner != '*'
+            ORDER BY resource_bytes + resume_bytes DESC
+            LIMIT ?
+            """,
+            (top,),
+        )
+        top_users = [dict(r) for r in cur.fetchall()]
+        user = None
+        if email:
+            row = conn.execute(
+                f"SELECT {columns}, resource_bytes + resume_bytes AS total_bytes FROM storage_usage WHERE owner = ?",
+                (email,),
+            ).fetchone()
+            user = dict(row) if row else None
+    totals = dict(totals) if totals else None
+    if totals:
+        totals["total_bytes"] = totals["resource_bytes"] + totals["resume_bytes"]
+    return {"totals": totals, "top_users": top_users, "user": user}
+
+
 def admin_update_user(db_path, email, full_name=None, new_email=None):
     with get_connection(db_path) as conn:
         if full_name:
@@ -780,28 +762,59 @@ def admin_delete_row(db_path, table_name, row_id):
         conn.commit()
         return cur.rowcount
 
-def save_chat_message(db_path, email, user_message, assistant_response, context=""):
-    """Save a chat message and response to chat history"""
-    with get_connection(db_path) as conn:
+
+def _save_chat_message_tx(conn, email, user_message, assistant_response, context):
+    context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest() if context else None
+    if context_hash:
         conn.execute(
-            """
-            INSERT INTO chat_history (email, user_message, assistant_response, context, created_at)
-            VALUES (?, ?, ?, ?, datetime('now'))
-            """,
-            (email, user_message, assistant_response, context)
+            "INSERT OR IGNORE INTO chat_contexts (hash, content) VALUES (?, ?)",
+            (context_hash, context),
         )
-        conn.commit()
+    conn.execute(
+        """
+        INSERT INTO chat_history (email, user_message, assistant_response, context_hash, created_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+        """,
+        (email, user_message, assistant_response, context_hash)
+    )
 
 
-def get_chat_history(db_path, email, limit=50):
+def save_chat_message(db_path, email, user_message, assistant_response, context=""):
+    """Save a chat message and response to chat history (context stored once per unique blob)"""
+    _queued_write(db_path, _save_chat_message_tx, email, user_message, assistant_response, context)
+
+
+def _chat_history_select(include_context):
+    """SELECT ... FROM clause for chat history reads; contexts are joined in only on request."""
+    if include_context:
+        return """
+            SELECT c.id, c.user_message, c.assistant_response, c.context_hash,
+                   COALESCE(x.content, c.context) AS context, c.created_at
+            FROM chat_history c
+            LEFT JOIN chat_contexts x ON x.hash = c.context_hash
+        """
+    return """
+            SELECT c.id, c.user_message, c.assistant_response, c.context_hash, c.created_at
+            FROM chat_history c
+        """
+
+
+def get_chat_context(db_path, context_hash):
+    """Return the context blob stored under context_hash, or None."""
+    with get_connection(db_path) as conn:
+        row = conn.execute(
+            "SELECT content FROM chat_contexts WHERE hash = ?", (context_hash,)
+        ).fetchone()
+        return row["content"] if row else None
+
+
+def get_chat_history(db_path, email, limit=50, include_context=False):
     """Retrieve chat history for a user (most recent first)"""
     with get_connection(db_path) as conn:
         cur = conn.execute(
-            """
-            SELECT id, user_message, assistant_response, context, created_at
-            FROM chat_history
-            WHERE email = ?
-            ORDER BY created_at DESC
+            _chat_history_select(include_context) + """
+            WHERE c.email = ?
+            ORDER BY c.created_at DESC
             LIMIT ?
             """,
             (email, limit)
@@ -809,15 +822,13 @@ def get_chat_history(db_path, email, limit=50):
         return [dict(row) for row in cur.fetchall()]
 
 
-def get_chat_history_paginated(db_path, email, offset=0, limit=20):
-    """Retrieve paginated chat history for a user"""
+def get_chat_history_paginated(db_path, email, offset=0, limit=20, include_context=False):
+    """Retrieve paginated chat history for a user (offset-based, kept for compatibility)"""
     with get_connection(db_path) as conn:
         cur = conn.execute(
-            """
-            SELECT id, user_message, assistant_response, context, created_at
-            FROM chat_history
-            WHERE email = ?
-            ORDER BY created_at DESC
+            _chat_history_select(include_context) + """
+            WHERE c.email = ?
+            ORDER BY c.created_at DESC
             LIMIT ? OFFSET ?
             """,
             (email, limit, offset)
@@ -825,10 +836,41 @@ def get_chat_history_paginated(db_path, email, offset=0, limit=20):
         return [dict(row) for row in cur.fetchall()]
 
 
+def get_chat_history_page(db_path, email, before_ts=None, before_id=None, limit=20,
+                          include_context=False):
+    """
+    Keyset-paginated chat history (most recent first).
+    Returns rows strictly older than (before_ts, before_id); pass neither for the first page.
+    """
+    select = _chat_history_select(include_context)
+    with get_connection(db_path) as conn:
+        if before_ts is not None and before_id is not None:
+            cur = conn.execute(
+                select + """
+                WHERE c.email = ? AND (c.created_at, c.id) < (?, ?)
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT ?
+                """,
+                (email, before_ts, before_id, limit),
+            )
+        else:
+            cur = conn.execute(
+                select + """
+                WHERE c.email = ?
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT ?
+                """,
+                (email, limit),
+            )
+        return [dict(row) for row in cur.fetchall()]
+
+
 def delete_chat_history(db_path, email):
     """Delete all chat history for a user"""
     with get_connection(db_path) as conn:
         cur = conn.execute("DELETE FROM chat_history WHERE email = ?", (email,))
+        conn.execute("DELETE FROM chat_memory WHERE email = ?", (email,))
+        conn.execute("DELETE FROM chat_archive WHERE email = ?", (email,))
         conn.commit()
         return cur.rowcount
 
@@ -841,6 +883,115 @@ def delete_chat_message(db_path, message_id):
         return cur.rowcount
 
 
+def _fts_owner_token(email):
+    return "o" + email.encode("utf-8").hex().upper()
+
+
+def _fts_match_expression(query):
+    """Quote each search term (prefix-matching the last one) so user input is never FTS syntax."""
+    terms = re.findall(r"\w+", query or "")
+    if not terms:
+        return None
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms[:16]]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_chat_history(db_path, email, query, limit=20, after_score=None, after_id=None):
+    """
+    Ranked full-text search over a user's chat history.
+    Results are ordered by bm25 score (best first), then id; pass the last
+    row's (score, id) to fetch the next page.
+    """
+    terms = _fts_match_expression(query)
+    if not terms:
+        return []
+    match = f'owner : "{_fts_owner_token(email)}" AND ({terms})'
+    params = [match]
+    keyset = ""
+    if after_score is not None and after_id is not None:
+        keyset = "WHERE score > ? OR (score = ? AND id < ?)"
+        params.extend([after_score, after_score, after_id])
+    params.append(limit)
+    with get_connection(db_path) as conn:
+        cur = conn.execute(
+            f"""
+            SELECT * FROM (
+                SELECT f.rowid AS id,
+                       bm25(chat_history_fts, 0.0, 2.0, 1.0) AS score,
+                       snippet(chat_history_fts, 1, '**', '**', '…', 12) AS user_snippet,
+                       snippet(chat_history_fts, 2, '**', '**', '…', 16) AS assistant_snippet,
+                       c.created_at
+                FROM chat_history_fts f
+                JOIN chat_history c ON c.id = f.rowid
+                WHERE chat_history_fts MATCH ? AND c.email = ?
+            )
+            {keyset}
+            ORDER BY score ASC, id DESC
+            LIMIT ?
+            """,
+            [params[0], email] + params[1:],
+        )
+        return [dict(row) for row in cur.fetchall()]
+
+
+def get_recent_chat_turns(db_path, email, limit=4):
+    """Return the most recent chat turns for a user (newest first)."""
+    with get_connection(db_path) as conn:
+        cur = conn.execute(
+            """
+            SELECT id, user_message, assistant_response
+            FROM chat_history
+            WHERE email = ?
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+            """,
+            (email, limit),
+        )
+        return [dict(row) for row in cur.fetchall()]
+
+
+def get_chat_turns_between(db_path, email, after_id, before_id, limit=20):
+    """Return chat turns with after_id < id < before_id (oldest first)."""
+    with get_connection(db_path) as conn:
+        cur = conn.execute(
+            """
+            SELECT id, user_message, assistant_response
+            FROM chat_history
+            WHERE email = ? AND id > ? AND id < ?
+            ORDER BY id ASC
+            LIMIT ?
+            """,
+            (email, after_id, before_id, limit),
+        )
+        return [dict(row) for row in cur.fetchall()]
+
+
+def get_chat_memory(db_path, email):
+    """Return the rolling conversation summary for a user, if any."""
+    with get_connection(db_path) as conn:
+        cur = conn.execute("SELECT * FROM chat_memory WHERE email = ?", (email,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+
+def save_chat_memory(db_path, email, summary, summarized_through_id, summary_tokens):
+    with get_connection(db_path) as conn:
+        conn.execute(
+            """
+            INSERT INTO chat_memory (email, summary, summarized_through_id, summary_tokens, updated_at)
+            VALUES (?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(email) DO UPDATE SET
+                summary = excluded.summary,
+                summarized_through_id = excluded.summarized_through_id,
+                summary_tokens = excluded.summary_tokens,
+                updated_at = excluded.updated_at
+            """,
+            (email, summary, summarized_through_id, summary_tokens),
+        )
+        conn.commit()
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Resources (Notes Platform)
 # ─────────────────────────────────────────────────────────────────────────────
@@ -865,38 +1016,13 @@ def create_resource(db_path, email, uploader_name, title, subject, branch,
 
 
 def get_resource_by_hash(db_path, file_hash):
+    """
+    Single indexed lookup. Legacy rows without a hash are filled in by the
+    file_hash_backfill background job (app/background_jobs.py), not here.
+    """
     if not file_hash:
         return None
     with get_connection(db_path) as conn:
-        # Backfill hashes for legacy rows that were created before hash support.
-        missing_rows = conn.execute(
-            """
-            SELECT id, file_path
-            FROM resources
-            WHERE status IN ('approved', 'pending')
-              AND (file_hash IS NULL OR file_hash = '')
-            """
-        ).fetchall()
-
-        for row in missing_rows:
-            try:
-                p = Path(row["file_path"])
-                if not p.exists() or not p.is_file():
-                    continue
-                data = p.read_bytes()
-                if not data:
-                    continue
-                computed_hash = hashlib.sha256(data).hexdigest()
-                conn.execute(
-                    "UPDATE resources SET file_hash = ?, file_size = ? WHERE id = ?",
-                    (computed_hash, len(data), row["id"]),
-                )
-            except Exception:
-                # Ignore unreadable files and keep processing others.
-                continue
-
-        conn.commit()
-
         cur = conn.execute(
             """
             SELECT * FROM resources
@@ -936,6 +1062,29 @@ def list_pending_resources(db_path):
         return [dict(r) for r in cur.fetchall()]
 
 
+def _attach_near_duplicates(conn, items):
+    """Add each item's flagged near-duplicates (best match first) as item["near_duplicates"]."""
+    for item in items:
+        item["near_duplicates"] = []
+    if not items:
+        return
+    by_id = {item["id"]: item for item in items}
+    placeholders = ",".join("?" * len(by_id))
+    cur = conn.execute(
+        f"""
+        SELECT d.resource_id, d.duplicate_of, d.similarity, r.title, r.status, r.uploader_name
+        FROM resource_near_duplicates d
+        JOIN resources r ON r.id = d.duplicate_of
+        WHERE d.resource_id IN ({placeholders})
+        ORDER BY d.similarity DESC
+        """,
+        list(by_id),
+    )
+    for row in cur.fetchall():
+        match = dict(row)
+        by_id[match.pop("resource_id")]["near_duplicates"].append(match)
+
+
 def list_pending_resources_paginated(db_path, page=1, page_size=3):
     page = max(1, int(page or 1))
     page_size = max(1, int(page_size or 3))
@@ -956,6 +1105,7 @@ def list_pending_resources_paginated(db_path, page=1, page_size=3):
             (page_size, offset),
         )
         items = [dict(r) for r in cur.fetchall()]
+        _attach_near_duplicates(conn, items)
 
     total_pages = (total + page_size - 1) // page_size if total else 1
     return {
@@ -1006,6 +1156,219 @@ def list_approved_resources_paginated(db_path, page=1, page_size=5):
     }
 
 
+# Columns returned by resource listings; omits file_path and reviewer details.
+_RESOURCE_LIST_COLUMNS = """
+    r.id, r.email, r.uploader_name, r.title, r.subject, r.branch, r.year_of_engineering,
+    r.academic_year, r.description, r.filename, r.file_hash, r.file_size, r.status,
+    r.uploaded_at, r.reviewed_at
+"""
+
+
+def _resource_filters(branch=None, year=None, subject=None, skip=None):
+    """WHERE fragments (on alias r) for the facet filters, leaving out `skip`."""
+    clauses, params = [], []
+    if branch and skip != "branch":
+        clauses.append("r.branch = ?")
+        params.append(branch)
+    if year and skip != "year":
+        clauses.append("r.year_of_engineering = ?")
+        params.append(year)
+    if subject and skip != "subject":
+        clauses.append("r.subject = ? COLLATE NOCASE")
+        params.append(subject)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def search_approved_resources(db_path, query=None, branch=None, year=None, subject=None,
+                              limit=20, after=None):
+    """
+    Approved resources matching the filters. With a query, results are ranked
+    by bm25 over title/subject/description/uploader/PDF text and `after` is the
+    last row's (score, id); without one, newest approvals come first and
+    `after` is the last row's (reviewed_at, id).
+    """
+    filters, params = _resource_filters(branch, year, subject)
+    terms = _fts_match_expression(query)
+    with get_connection(db_path) as conn:
+        if terms:
+            keyset = ""
+            if after is not None:
+                keyset = "WHERE score > ? OR (score = ? AND id < ?)"
+                params += [after[0], after[0], after[1]]
+            cur = conn.execute(
+                f"""
+                SELECT * FROM (
+                    SELECT {_RESOURCE_LIST_COLUMNS},
+                           bm25(resources_fts, 5.0, 3.0, 2.0, 1.0, 1.0) AS score,
+                           snippet(resources_fts, -1, '**', '**', '…', 16) AS snippet
+                    FROM resources_fts f
+                    JOIN resources r ON r.id = f.rowid
+                    WHERE resources_fts MATCH ?{filters}
+                )
+                {keyset}
+                ORDER BY score ASC, id DESC
+                LIMIT ?
+                """,
+                [terms] + params + [limit],
+            )
+        else:
+            if after is not None:
+                filters += " AND (r.reviewed_at < ? OR (r.reviewed_at = ? AND r.id < ?))"
+                params += [after[0], after[0], after[1]]
+            cur = conn.execute(
+                f"""
+                SELECT {_RESOURCE_LIST_COLUMNS}
+                FROM resources r
+                WHERE r.status = 'approved'{filters}
+                ORDER BY r.reviewed_at DESC, r.id DESC
+                LIMIT ?
+                """,
+                params + [limit],
+            )
+        return [dict(row) for row in cur.fetchall()]
+
+
+def get_resource_facets(db_path, query=None, branch=None, year=None, subject=None):
+    """
+    Per-branch, per-year and per-subject counts of approved resources matching
+    the query. Each facet applies the other two filters but not its own, so
+    the counts show what switching that filter would return. Also returns
+    the total for the full filter set.
+    """
+    terms = _fts_match_expression(query)
+    if terms:
+        source = "resources_fts f JOIN resources r ON r.id = f.rowid WHERE resources_fts MATCH ?"
+        base_params = [terms]
+    else:
+        source = "resources r WHERE r.status = 'approved'"
+        base_params = []
+    facets = {}
+    with get_connection(db_path) as conn:
+        for facet, column in (("branch", "r.branch"), ("year", "r.year_of_engineering"),
+                              ("subject", "r.subject COLLATE NOCASE")):
+            filters, params = _resource_filters(branch, year, subject, skip=facet)
+            cur = conn.execute(
+                f"""
+                SELECT {column} AS value, COUNT(*) AS count
+                FROM {source}{filters}
+                GROUP BY {column}
+                ORDER BY count DESC, value
+                """,
+                base_params + params,
+            )
+            facets[facet] = [dict(row) for row in cur.fetchall()]
+        filters, params = _resource_filters(branch, year, subject)
+        total = conn.execute(f"SELECT COUNT(*) FROM {source}{filters}", base_params + params).fetchone()[0]
+    return {"total": total, "facets": facets}
+
+
+def get_related_resources(db_path, resource_id, limit=10):
+    """Precomputed neighbours of a resource (see related_resources.py), most similar first."""
+    with get_connection(db_path) as conn:
+        cur = conn.execute(
+            f"""
+            SELECT {_RESOURCE_LIST_COLUMNS}, n.score
+            FROM resource_neighbors n
+            JOIN resources r ON r.id = n.neighbor_id
+            WHERE n.resource_id = ? AND r.status = 'approved'
+            ORDER BY n.score DESC, n.neighbor_id
+            LIMIT ?
+            """,
+            (resource_id, limit),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+
+def add_resource_stat_counts(db_path, counts, prune_before=None):
+    """
+    Apply buffered counters (see resource_stats.py) in one transaction.
+    `counts` maps (resource_id, day) to (downloads, views); counts for
+    resources deleted since they were recorded are dropped. Daily buckets
+    older than `prune_before` ('YYYY-MM-DD') are removed.
+    """
+    ids = sorted({rid for rid, _ in counts})
+    with open_connection(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        live = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            live.update(row[0] for row in conn.execute(
+                f"SELECT id FROM resources WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        totals = {}
+        daily = []
+        for (rid, day), (downloads, views) in counts.items():
+            if rid not in live:
+                continue
+            daily.append((rid, day, downloads, views))
+            previous = totals.get(rid, (0, 0))
+            totals[rid] = (previous[0] + downloads, previous[1] + views)
+        conn.executemany(
+            """
+            INSERT INTO resource_stats_daily (resource_id, day, downloads, views) VALUES (?, ?, ?, ?)
+            ON CONFLICT(day, resource_id) DO UPDATE SET
+                downloads = downloads + excluded.downloads,
+                views = views + excluded.views
+            """,
+            daily,
+        )
+        conn.executemany(
+            """
+            INSERT INTO resource_stats (resource_id, downloads, views) VALUES (?, ?, ?)
+            ON CONFLICT(resource_id) DO UPDATE SET
+                downloads = downloads + excluded.downloads,
+                views = views + excluded.views,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            [(rid, downloads, views) for rid, (downloads, views) in totals.items()],
+        )
+        if prune_before:
+            conn.execute("DELETE FROM resource_stats_daily WHERE day < ?", (prune_before,))
+        conn.commit()
+
+
+def get_popular_resources(db_path, days=7, limit=10):
+    """
+    Approved resources with the most downloads over the last `days` UTC days
+    (today included), summed from the daily buckets; lifetime totals alongside.
+    """
+    with get_connection(db_path) as conn:
+        cur = conn.execute(
+            f"""
+            SELECT {_RESOURCE_LIST_COLUMNS},
+                   p.downloads, p.views,
+                   s.downloads AS total_downloads, s.views AS total_views
+            FROM (
+                SELECT resource_id, SUM(downloads) AS downloads, SUM(views) AS views
+                FROM resource_stats_daily
+                WHERE day >= date('now', ?)
+                GROUP BY resource_id
+            ) AS p
+            JOIN resources r ON r.id = p.resource_id
+            LEFT JOIN resource_stats s ON s.resource_id = p.resource_id
+            WHERE r.status = 'approved' AND p.downloads > 0
+            ORDER BY p.downloads DESC, p.views DESC, r.id
+            LIMIT ?
+            """,
+            (f"-{max(int(days), 1) - 1} days", limit),
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+
+def get_resources_by_ids(db_path, resource_ids):
+    """Full rows for the given resource ids, in the order given; unknown ids are left out."""
+    ids = list(dict.fromkeys(int(resource_id) for resource_id in resource_ids))
+    rows = {}
+    with get_connection(db_path) as conn:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cur = conn.execute(
+                f"SELECT * FROM resources WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            rows.update((row["id"], dict(row)) for row in cur.fetchall())
+    return [rows[resource_id] for resource_id in ids if resource_id in rows]
+
+
 def list_user_resources(db_path, email):
     with get_connection(db_path) as conn:
         cur = conn.execute(
@@ -1033,6 +1396,40 @@ def reject_resource(db_path, resource_id, admin_email):
         conn.commit()
 
 
+def review_pending_resources(db_path, resource_ids, status, admin_email):
+    """
+    Approve or reject many pending resources in one transaction. Returns the
+    rows that were changed; ids that are unknown or no longer pending are
+    left out.
+    """
+    if status not in ("approved", "rejected"):
+        raise ValueError(f"invalid review status: {status}")
+    ids = sorted({int(resource_id) for resource_id in resource_ids})
+    if not ids:
+        return []
+    placeholders = ",".join("?" * len(ids))
+    with open_connection(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            f"""
+            SELECT id, email, uploader_name, title, subject, branch, year_of_engineering
+            FROM resources WHERE id IN ({placeholders}) AND status = 'pending'
+            """,
+            ids,
+        ).fetchall()
+        changed = [row["id"] for row in rows]
+        if changed:
+            conn.execute(
+                f"""
+                UPDATE resources SET status = ?, reviewed_at = datetime('now'), reviewed_by = ?
+                WHERE id IN ({",".join("?" * len(changed))})
+                """,
+                [status, admin_email] + changed,
+            )
+        conn.commit()
+    return [dict(row) for row in rows]
+
+
 def get_resource_by_id(db_path, resource_id):
     with get_connection(db_path) as conn:
         cur = conn.execute("SELECT * FROM resources WHERE id = ?", (resource_id,))
@@ -1142,6 +1539,32 @@ def add_resource_comment(db_path, resource_id, commenter_email, commenter_name,
         return cur.lastrowid
 
 
+def add_resource_comments(db_path, resource_ids, commenter_email, commenter_name,
+                          comment, is_admin=False):
+    """Add the same comment to many resources in one transaction. Returns the resources commented on."""
+    ids = sorted({int(resource_id) for resource_id in resource_ids})
+    if not ids:
+        return []
+    placeholders = ",".join("?" * len(ids))
+    with open_connection(db_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            f"""
+            SELECT id, email, uploader_name, title, subject, branch, year_of_engineering
+            FROM resources WHERE id IN ({placeholders})
+            """,
+            ids,
+        ).fetchall()
+        conn.executemany(
+            """INSERT INTO resource_comments
+               (resource_id, commenter_email, commenter_name, comment, is_admin)
+               VALUES (?, ?, ?, ?, ?)""",
+            [(row["id"], commenter_email, commenter_name, comment, 1 if is_admin else 0) for row in rows],
+        )
+        conn.commit()
+    return [dict(row) for row in rows]
+
+
 def get_resource_comments(db_path, resource_id):
     with get_connection(db_path) as conn:
         cur = conn.execute(
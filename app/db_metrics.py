@@ -0,0 +1,174 @@
+"""
+DB Metrics - Per-statement timing and slow-query log for SQLite helpers
+
+Every statement executed through a connection from app.db is timed and
+attributed to its SQL fingerprint (literals and placeholder lists collapsed)
+and to the calling helper. For each we keep counts, total/max time, a latency
+histogram and a rolling window of recent samples for percentiles. Statements
+slower than SLOW_QUERY_MS are logged with the shape of their parameters
+(types and lengths, never values) and kept in a short ring buffer.
+
+Admins read the report at /api/admin/db/slow-queries.
+"""
+import logging
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended.
+HISTOGRAM_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+ROLLING_SAMPLES = 256
+SLOW_LOG_SIZE = 100
+
+_enabled = True
+_slow_query_ms = 100.0
+_lock = threading.Lock()
+_by_fingerprint: Dict[str, "_Stats"] = {}
+_by_caller: Dict[str, "_Stats"] = {}
+_slow_log = deque(maxlen=SLOW_LOG_SIZE)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class _Stats:
+    __slots__ = ("count", "total_ms", "max_ms", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=ROLLING_SAMPLES)
+
+    def add(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        index = len(HISTOGRAM_BUCKETS_MS)
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.recent.append(elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+
+        def pct(p):
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 3)
+
+        labels = [f"<={b}ms" for b in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "histogram": {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+def configure(enabled: bool = True, slow_query_ms: float = 100.0):
+    global _enabled, _slow_query_ms
+    _enabled = bool(enabled)
+    _slow_query_ms = float(slow_query_ms)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize SQL so statements differing only in literals share a fingerprint."""
+    text = _STRING_RE.sub("?", sql)
+    text = _NUMBER_RE.sub("?", text)
+    text = _PLACEHOLDER_LIST_RE.sub("IN (?+)", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def parameter_shape(parameters) -> Any:
+    """Describe bound parameters by type and size only, so the slow log never holds user data."""
+    def describe(value):
+        if value is None:
+            return "null"
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return {key: describe(value) for key, value in parameters.items()}
+    try:
+        return [describe(value) for value in parameters]
+    except TypeError:
+        return describe(parameters)
+
+
+def caller_name(frame) -> str:
+    if frame is None:
+        return "?"
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{frame.f_code.co_name}"
+
+
+def record(sql: str, parameters, elapsed_s: float, frame=None):
+    """Record one executed statement."""
+    elapsed_ms = elapsed_s * 1000.0
+    fp = fingerprint(sql)
+    caller = caller_name(frame)
+    with _lock:
+        stats = _by_fingerprint.get(fp)
+        if stats is None:
+            stats = _by_fingerprint[fp] = _Stats()
+        stats.add(elapsed_ms)
+        stats = _by_caller.get(caller)
+        if stats is None:
+            stats = _by_caller[caller] = _Stats()
+        stats.add(elapsed_ms)
+    if elapsed_ms >= _slow_query_ms:
+        entry = {
+            "elapsed_ms": round(elapsed_ms, 3),
+            "fingerprint": fp,
+            "caller": caller,
+            "params": parameter_shape(parameters),
+        }
+        with _lock:
+            _slow_log.append(entry)
+        logger.warning(f"Slow query {entry['elapsed_ms']}ms in {caller}: {fp} params={entry['params']}")
+
+
+def report(limit: int = 20, sort: str = "total_ms") -> Dict[str, Any]:
+    """Top-N fingerprints and callers by `sort` (total_ms, avg_ms, max_ms, p95_ms, count)."""
+    with _lock:
+        fingerprints = [{"fingerprint": fp, **s.snapshot()} for fp, s in _by_fingerprint.items()]
+        callers = [{"caller": name, **s.snapshot()} for name, s in _by_caller.items()]
+        slow = list(_slow_log)
+
+    def top(rows: List[Dict[str, Any]]):
+        return sorted(rows, key=lambda row: row.get(sort, 0), reverse=True)[:limit]
+
+    return {
+        "enabled": _enabled,
+        "slow_query_ms": _slow_query_ms,
+        "sort": sort,
+        "fingerprints": top(fingerprints),
+        "callers": top(callers),
+        "recent_slow": list(reversed(slow))[:limit],
+    }
+
+
+def reset():
+    with _lock:
+        _by_fingerprint.clear()
+        _by_caller.clear()
+        _slow_log.clear()
@@ -0,0 +1,145 @@
+"""
+Document Text - Extracted-text cache keyed by file hash
+
+Text is pulled out of a stored file once per unique content (file_hash) and
+kept in the document_text table as per-page text with the page count,
+extraction method and time taken. Resource uploads queue extraction on a
+background thread right away, so by the time someone asks for an AI
+refinement the text is usually already there; consumers go through
+get_or_extract_text(), which falls back to extracting inline on a miss.
+
+Extraction failures caused by the document itself are cached too (the bytes
+behind a hash never change, so retrying cannot help); a missing or unreadable
+file is not, so it is retried once the file is back.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .db import get_connection
+
+logger = logging.getLogger(__name__)
+
+METHOD_PYPDF2 = "pypdf2"
+
+_extract_lock = threading.Lock()
+_extract_in_flight: Dict[str, List[Callable]] = {}
+
+
+def extract_pdf_pages(file_path: str) -> List[str]:
+    """Per-page text of a PDF ('' for pages without a text layer)."""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(file_path)
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+def join_pages(pages: List[str]) -> str:
+    return "\n\n".join(page for page in pages if page).strip()
+
+
+def get_document_text(db_path: str, file_hash: str) -> Optional[Dict]:
+    with get_connection(db_path) as conn:
+        row = conn.execute("SELECT * FROM document_text WHERE file_hash = ?", (file_hash,)).fetchone()
+    if not row:
+        return None
+    record = dict(row)
+    record["pages"] = json.loads(record["pages"])
+    record["text"] = join_pages(record["pages"])
+    return record
+
+
+def save_document_text(db_path: str, file_hash: str, pages: List[str], method: str,
+                       extract_ms: float, error: Optional[str] = None):
+    with get_connection(db_path) as conn:
+        conn.execute(
+            """
+            INSERT INTO document_text
+                (file_hash, status, method, page_count, pages, char_count, extract_ms, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(file_hash) DO UPDATE SET
+                status = excluded.status, method = excluded.method,
+                page_count = excluded.page_count, pages = excluded.pages,
+                char_count = excluded.char_count, extract_ms = excluded.extract_ms,
+                error = excluded.error, created_at = CURRENT_TIMESTAMP
+            """,
+            (
+                file_hash,
+                "failed" if error else "ok",
+                method,
+                len(pages),
+                json.dumps(pages),
+                sum(len(page) for page in pages),
+                round(extract_ms, 3),
+                error,
+            ),
+        )
+        conn.commit()
+
+
+def extract_and_cache(db_path: str, file_hash: str, file_path: str,
+                      extractor: Callable[[str], List[str]] = extract_pdf_pages,
+                      method: str = METHOD_PYPDF2) -> Dict:
+    """Extract `file_path` with `extractor` and store the result under file_hash."""
+    started = time.perf_counter()
+    try:
+        pages = extractor(file_path)
+        error = None
+    except OSError:
+        # The file is missing or unreadable; nothing about the content is known yet.
+        raise
+    except Exception as e:
+        pages, error = [], str(e)
+        logger.error(f"Error extracting text for {file_hash[:12]}: {error}")
+    extract_ms = (time.perf_counter() - started) * 1000.0
+    save_document_text(db_path, file_hash, pages, method, extract_ms, error)
+    return get_document_text(db_path, file_hash)
+
+
+def get_or_extract_text(db_path: str, file_hash: Optional[str], file_path: str) -> str:
+    """Cached text for a stored PDF, extracting (and caching) it on a miss. '' when unreadable."""
+    try:
+        if not file_hash:
+            return join_pages(extract_pdf_pages(file_path))
+        record = get_document_text(db_path, file_hash) or extract_and_cache(db_path, file_hash, file_path)
+    except Exception as e:
+        logger.error(f"Error extracting PDF text: {str(e)}")
+        return ""
+    return record["text"]
+
+
+def schedule_text_extraction(db_path: str, file_hash: Optional[str], file_path: str,
+                             on_ready: Optional[Callable[[Dict], None]] = None):
+    """
+    Warm the cache for a freshly stored PDF on a daemon thread; at most one
+    run per hash. on_ready(record) is called once the text is available,
+    including when a run for the same hash is already in flight.
+    """
+    if not file_hash:
+        return
+    with _extract_lock:
+        waiting = _extract_in_flight.get(file_hash)
+        if waiting is not None:
+            if on_ready:
+                waiting.append(on_ready)
+            return
+        _extract_in_flight[file_hash] = [on_ready] if on_ready else []
+
+    def _run():
+        record = None
+        try:
+            record = get_document_text(db_path, file_hash) or extract_and_cache(db_path, file_hash, file_path)
+        except Exception as e:
+            logger.error(f"Error extracting text for {file_hash[:12]}: {str(e)}")
+        finally:
+            with _extract_lock:
+                callbacks = _extract_in_flight.pop(file_hash, [])
+        for callback in callbacks:
+            try:
+                callback(record)
+            except Exception as e:
+                logger.error(f"Error in text-ready callback for {file_hash[:12]}: {str(e)}")
+
+    threading.Thread(target=_run, name="document-text", daemon=True).start()
@@ -1,10 +1,15 @@
+import logging
 import smtplib
+from contextlib import contextmanager
 from email.message import EmailMessage
 
 from flask import current_app
 
+logger = logging.getLogger(__name__)
 
-def send_email(to_email, subject, body):
+
+@contextmanager
+def _smtp_session():
     host = current_app.config["SMTP_HOST"]
     port = current_app.config["SMTP_PORT"]
     user = current_app.config["SMTP_USER"]
@@ -14,18 +19,42 @@ def send_email(to_email, subject, body):
     if not host or not port or not user or not password:
         raise ValueError("SMTP configuration is incomplete.")
 
-    message = EmailMessage()
-    message["From"] = user
-    message["To"] = to_email
-    message["Subject"] = subject
-    message.set_content(body)
-
     if use_tls:
         with smtplib.SMTP(host, port) as smtp:
             smtp.starttls()
             smtp.login(user, password)
-            smtp.send_message(message)
+            yield smtp, user
     else:
         with smtplib.SMTP_SSL(host, port) as smtp:
             smtp.login(user, password)
-            smtp.send_message(message)
+            yield smtp, user
+
+
+def _message(sender, to_email, subject, body):
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+def send_email(to_email, subject, body):
+    with _smtp_session() as (smtp, sender):
+        smtp.send_message(_message(sender, to_email, subject, body))
+
+
+def send_emails(messages):
+    """
+    Send (to_email, subject, body) messages over a single SMTP connection.
+    A message the server refuses is logged and skipped. Returns the number sent.
+    """
+    sent = 0
+    with _smtp_session() as (smtp, sender):
+        for to_email, subject, body in messages:
+            try:
+                smtp.send_message(_message(sender, to_email, subject, body))
+                sent += 1
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                logger.warning("Failed to send email to %s: %s", to_email, e)
+    return sent
@@ -0,0 +1,85 @@
+"""
+File Serving - Cacheable, resumable responses for stored resources and resumes
+
+Every stored file is known by its SHA-256 (file_hash), which doubles as a
+strong ETag: browsers revalidate with If-None-Match and get a bodiless 304
+when nothing changed, and PDF viewers fetch byte ranges (206) instead of the
+whole document. URLs carrying ?v=<file_hash> are content-addressed, so those
+responses are marked immutable and cached for a year; unversioned URLs must
+revalidate because a resource can be re-uploaded under the same id.
+
+Behind nginx, FILE_ACCEL_MODE=nginx hands blob-store files off with
+X-Accel-Redirect so Python workers never read file bytes; nginx needs an
+internal location mapping FILE_ACCEL_PREFIX onto BLOB_STORE_DIR, e.g.
+
+    location /_blobs/ { internal; alias /srv/preppulse/data/blobs/; etag off; }
+
+FILE_ACCEL_MODE=sendfile turns on Flask's USE_X_SENDFILE (Apache/lighttpd).
+"""
+import os
+import urllib.parse
+from typing import Optional
+
+from flask import Response, current_app, request, send_file
+
+from .storage import is_blob_path
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _cache_control(file_hash: Optional[str]) -> str:
+    # Files are per-user or moderated, so shared caches must never keep them.
+    if file_hash and request.args.get("v") == file_hash:
+        return f"private, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return "private, no-cache"
+
+
+def _content_disposition(download_name: str, as_attachment: bool) -> str:
+    kind = "attachment" if as_attachment else "inline"
+    try:
+        download_name.encode("ascii")
+        return f'{kind}; filename="{download_name}"'
+    except UnicodeEncodeError:
+        quoted = urllib.parse.quote(download_name, safe="")
+        return f"{kind}; filename*=UTF-8''{quoted}"
+
+
+def _accel_redirect(path: str, file_hash: str, mimetype: str, download_name: str,
+                    as_attachment: bool) -> Response:
+    if file_hash in request.if_none_match:
+        response = Response(status=304)
+    else:
+        blob_dir = os.path.realpath(current_app.config["BLOB_STORE_DIR"])
+        relative = os.path.relpath(os.path.realpath(path), blob_dir).replace(os.sep, "/")
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = current_app.config["FILE_ACCEL_PREFIX"].rstrip("/") + "/" + relative
+        response.headers["Content-Disposition"] = _content_disposition(download_name, as_attachment)
+    response.set_etag(file_hash)
+    return response
+
+
+def send_stored_file(path: str, file_hash: Optional[str], mimetype: str, download_name: str,
+                     as_attachment: bool = False) -> Response:
+    """
+    Serve a stored file with a content-hash ETag, conditional GET and Range
+    support. Callers do their own access checks first.
+    """
+    if (
+        file_hash
+        and current_app.config.get("FILE_ACCEL_MODE") == "nginx"
+        and is_blob_path(current_app.config["BLOB_STORE_DIR"], path)
+    ):
+        response = _accel_redirect(path, file_hash, mimetype, download_name, as_attachment)
+    else:
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            # Legacy rows without a hash fall back to werkzeug's mtime/size ETag.
+            etag=file_hash or True,
+            conditional=True,
+        )
+    response.headers["Cache-Control"] = _cache_control(file_hash)
+    response.headers.pop("Expires", None)
+    return response
@@ -0,0 +1,432 @@
+"""
+Guardrail Classifier - Local, CPU-only pre-LLM screening of chatbot messages
+
+A small multinomial logistic regression over hashed word n-grams. It is trained
+from seed examples for each category in CHATBOT_GUARDRAILS.txt plus any
+labelled chat history, and lets /chat answer clearly out-of-scope requests with
+a template before any retrieval or LLM work happens.
+
+The short-circuit only runs for a model whose k-fold cross-validated accuracy
+(recorded when it is trained) reaches GUARDRAIL_MIN_CV_ACCURACY, so a model
+trained on the seed examples alone stays advisory until labelled chat history
+makes it trustworthy.
+
+Offline usage:
+    python -m app.guardrail_classifier --evaluate
+    python -m app.guardrail_classifier --train --labels labels.jsonl --db data/preppulse.db
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = Path(__file__).parent.parent / "data" / "guardrail_classifier.json"
+# Minimum cross-validated accuracy before /chat may answer from a template.
+MIN_CV_ACCURACY = 0.85
+
+LABEL_ALLOWED = "allowed"
+LABEL_ASSESSMENT = "assessment_solving"
+LABEL_GRADING = "grading"
+LABEL_OFF_TOPIC = "off_topic"
+LABELS = [LABEL_ALLOWED, LABEL_ASSESSMENT, LABEL_GRADING, LABEL_OFF_TOPIC]
+
+# Template replies mirror the example responses in CHATBOT_GUARDRAILS.txt.
+TEMPLATE_REPLIES = {
+    LABEL_ASSESSMENT: (
+        "I can't solve assessment, quiz or homework questions for you - that wouldn't help your learning! "
+        "Tell me which concept the question is about and I'll explain it so you can work through it yourself."
+    ),
+    LABEL_GRADING: (
+        "I can't grade or check answers, but I can help you verify your own work. "
+        "Walk me through your approach and I'll point you to the concepts worth reviewing."
+    ),
+    LABEL_OFF_TOPIC: (
+        "I'm your PrepPulse learning assistant, so I can only help with studying, courses, "
+        "resources, resumes and placement preparation. What would you like to learn today?"
+    ),
+}
+
+# Seed examples per guardrail category. Extend via labelled chat history rather
+# than by growing this list.
+SEED_EXAMPLES = {
+    LABEL_ALLOWED: [
+        "explain how binary search works",
+        "what is the difference between a process and a thread",
+        "can you help me understand dynamic programming",
+        "which course should I take to learn python",
+        "recommend resources for operating systems",
+        "how do I prepare for placement interviews",
+        "what topics are covered in the dbms course",
+        "give me a study plan for data structures",
+        "how can I improve my resume for software roles",
+        "explain normalization in databases with an example",
+        "what is the time complexity of merge sort and why",
+        "suggest a learning path for web development",
+        "how do hash tables handle collisions",
+        "what certifications are available for cloud computing",
+        "I am weak in graphs, what should I revise",
+        "explain tcp vs udp in simple terms",
+        "who uploaded the computer networks notes",
+        "show me resources for machine learning",
+        "how do I track my progress on habits",
+        "what does the system design course cover",
+        "tips for behavioral interview questions",
+        "how should I practice for coding interviews",
+        "explain recursion with a simple analogy",
+        "what is a deadlock and how can it be prevented",
+        "how can I stay consistent while studying",
+        "what are the prerequisites for the ai course",
+        "explain object oriented programming concepts",
+        "how do indexes speed up database queries",
+        "help me understand the concept behind this error in my loop",
+        "what skills do I need for a data analyst role",
+        "summarize the key ideas of operating system scheduling",
+        "how many modules are in the python bootcamp",
+        # Resume review and mock-test tracking are PrepPulse features, not grading.
+        "grade my resume",
+        "review my resume and tell me what to improve",
+        "check my resume for mistakes",
+        "rate my resume out of ten",
+        "what is my ats score",
+        "how can I raise my resume ats score",
+        "is my resume good enough for product companies",
+        "give feedback on my resume summary",
+        "grade my mock test answers",
+        "analyze my mock test scores",
+        "how did I do on my last mock test",
+        "my mock test score dropped, what should I focus on",
+        "review my mock test performance this month",
+        "compare my mock test results over time",
+    ],
+    LABEL_ASSESSMENT: [
+        "solve this quiz question for me",
+        "what is the answer to question 5 of the assessment",
+        "give me the answers to the practice test",
+        "solve my homework assignment",
+        "can you just give me the answer",
+        "write the code solution for this exam problem",
+        "complete my assignment on linked lists",
+        "what are the answers for the mock test",
+        "solve this exam problem step by step",
+        "tell me the correct option for question 3",
+        "do my lab assignment for me",
+        "give me the full solution to this coding problem",
+        "answer all the questions in this quiz",
+        "solve the assessment questions in the course",
+        "write the program for my assignment submission",
+        "what is the answer to this test question",
+        "provide solutions for the homework problems",
+        "give me the final answer only no explanation",
+        "finish this assignment before the deadline for me",
+        "solve question 2 from the exam paper",
+        "which option is correct a b c or d",
+        "just write the answer for my quiz",
+    ],
+    LABEL_GRADING: [
+        "is my answer correct",
+        "grade my code",
+        "how many points would this get",
+        "would this pass the grade",
+        "what score would I get for this answer",
+        "check if I did this correctly",
+        "is this right or wrong",
+        "here is my solution check it",
+        "grade my assignment out of ten",
+        "mark my exam answers",
+        "evaluate my answer and give me marks",
+        "did I get question 4 right",
+        "tell me if my quiz answers are correct",
+        "give my essay a grade",
+        "score my test submission",
+        "is my solution to the assessment correct",
+        "how many marks will I lose for this",
+        "rate my answer for the exam question",
+    ],
+    LABEL_OFF_TOPIC: [
+        "what is the weather today",
+        "tell me a joke",
+        "who won the football match yesterday",
+        "recommend a good movie to watch tonight",
+        "what is the best pizza recipe",
+        "write a love letter for my girlfriend",
+        "what is the price of bitcoin",
+        "book a flight to paris",
+        "who is the richest person in the world",
+        "suggest songs for a party playlist",
+        "what should I cook for dinner",
+        "tell me celebrity gossip",
+        "predict the lottery numbers",
+        "what is your favorite color",
+        "plan my vacation itinerary",
+        "which phone should I buy",
+        "write a poem about the moon",
+        "how do I lose weight fast",
+        "what is the score of the cricket match",
+        "give me dating advice",
+        "recommend a netflix series",
+        "what is the latest political news",
+    ],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _hash_feature(token: str, n_features: int) -> int:
+    return zlib.crc32(token.encode("utf-8")) % n_features
+
+
+def extract_features(text: str, n_features: int) -> Dict[int, float]:
+    """Return hashed, L2-normalized unigram, bigram and word-prefix counts for text."""
+    tokens = _TOKEN_RE.findall(str(text or "").lower())
+    grams = list(tokens)
+    grams.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    # Prefixes let "answers"/"answering" share weight with "answer".
+    grams.extend(f"#{t[:4]}" for t in tokens if len(t) > 4)
+    features: Dict[int, float] = {}
+    for gram in grams:
+        idx = _hash_feature(gram, n_features)
+        features[idx] = features.get(idx, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in features.values()))
+    if norm:
+        for idx in features:
+            features[idx] /= norm
+    return features
+
+
+class GuardrailClassifier:
+    """Multinomial logistic regression over hashed n-grams"""
+
+    def __init__(self, labels: List[str] = None, n_features: int = 2 ** 18):
+        self.labels = list(labels or LABELS)
+        self.n_features = n_features
+        self.bias = [0.0] * len(self.labels)
+        self.weights: Dict[int, List[float]] = {}
+        # k-fold accuracy on the training examples; None when never measured.
+        self.cv_accuracy: Optional[float] = None
+
+    def _scores(self, features: Dict[int, float]) -> List[float]:
+        scores = list(self.bias)
+        for idx, value in features.items():
+            row = self.weights.get(idx)
+            if row is None:
+                continue
+            for k, w in enumerate(row):
+                scores[k] += w * value
+        return scores
+
+    @staticmethod
+    def _softmax(scores: List[float]) -> List[float]:
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        probs = self._softmax(self._scores(extract_features(text, self.n_features)))
+        return dict(zip(self.labels, probs))
+
+    def is_trusted(self, min_accuracy: float = MIN_CV_ACCURACY) -> bool:
+        """Whether the measured cross-validation accuracy is high enough to act on."""
+        return self.cv_accuracy is not None and self.cv_accuracy >= min_accuracy
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Return (label, confidence) for text."""
+        probs = self.predict_proba(text)
+        label = max(probs, key=probs.get)
+        return label, probs[label]
+
+    def fit(self, examples: List[Tuple[str, str]], epochs: int = 40,
+            learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 0):
+        """Train with plain SGD on (text, label) pairs."""
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        data = [
+            (extract_features(text, self.n_features), label_index[label])
+            for text, label in examples
+            if label in label_index
+        ]
+        rng = random.Random(seed)
+        n_labels = len(self.labels)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            lr = learning_rate / (1.0 + 0.1 * epoch)
+            for features, target in data:
+                probs = self._softmax(self._scores(features))
+                grads = [p - (1.0 if k == target else 0.0) for k, p in enumerate(probs)]
+                for k in range(n_labels):
+                    self.bias[k] -= lr * grads[k]
+                for idx, value in features.items():
+                    row = self.weights.setdefault(idx, [0.0] * n_labels)
+                    for k in range(n_labels):
+                        row[k] -= lr * (grads[k] * value + l2 * row[k])
+        return self
+
+    def to_dict(self) -> Dict:
+        return {
+            "labels": self.labels,
+            "n_features": self.n_features,
+            "bias": self.bias,
+            "weights": {str(idx): row for idx, row in self.weights.items()},
+            "cv_accuracy": self.cv_accuracy,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GuardrailClassifier":
+        model = cls(labels=data["labels"], n_features=int(data["n_features"]))
+        model.bias = [float(b) for b in data["bias"]]
+        model.weights = {int(idx): [float(w) for w in row] for idx, row in data["weights"].items()}
+        model.cv_accuracy = data.get("cv_accuracy")
+        return model
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: Path) -> "GuardrailClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def seed_examples() -> List[Tuple[str, str]]:
+    return [(text, label) for label, texts in SEED_EXAMPLES.items() for text in texts]
+
+
+def load_labelled_examples(labels_path: Path, db_path: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    Load labelled examples from a JSONL file.
+    Each line is {"text": ..., "label": ...} or {"chat_history_id": ..., "label": ...};
+    the latter reads the user message from chat_history in db_path.
+    """
+    examples = []
+    pending_ids = {}
+    with open(labels_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            label = record.get("label")
+            if label not in LABELS:
+                continue
+            if record.get("text"):
+                examples.append((record["text"], label))
+            elif record.get("chat_history_id") is not None:
+                pending_ids[int(record["chat_history_id"])] = label
+
+    if pending_ids and db_path:
+        conn = sqlite3.connect(db_path)
+        try:
+            for message_id, label in pending_ids.items():
+                row = conn.execute(
+                    "SELECT user_message FROM chat_history WHERE id = ?", (message_id,)
+                ).fetchone()
+                if row and row[0]:
+                    examples.append((row[0], label))
+        finally:
+            conn.close()
+    return examples
+
+
+def evaluate(model: GuardrailClassifier, examples: List[Tuple[str, str]]) -> Dict:
+    """Return accuracy and per-label precision/recall for model on examples."""
+    counts = {label: {"tp": 0, "fp": 0, "fn": 0} for label in model.labels}
+    correct = 0
+    for text, expected in examples:
+        predicted, _ = model.classify(text)
+        if predicted == expected:
+            correct += 1
+            counts[expected]["tp"] += 1
+        else:
+            counts[predicted]["fp"] += 1
+            if expected in counts:
+                counts[expected]["fn"] += 1
+    per_label = {}
+    for label, c in counts.items():
+        precision = c["tp"] / (c["tp"] + c["fp"]) if c["tp"] + c["fp"] else 0.0
+        recall = c["tp"] / (c["tp"] + c["fn"]) if c["tp"] + c["fn"] else 0.0
+        per_label[label] = {"precision": round(precision, 3), "recall": round(recall, 3)}
+    return {
+        "examples": len(examples),
+        "accuracy": round(correct / len(examples), 3) if examples else 0.0,
+        "per_label": per_label,
+    }
+
+
+def cross_validate(examples: List[Tuple[str, str]], folds: int = 5, seed: int = 0) -> Dict:
+    """k-fold cross-validation accuracy for offline measurement."""
+    data = list(examples)
+    random.Random(seed).shuffle(data)
+    accuracies = []
+    for fold in range(folds):
+        test = data[fold::folds]
+        train = [ex for i, ex in enumerate(data) if i % folds != fold]
+        model = GuardrailClassifier().fit(train)
+        accuracies.append(evaluate(model, test)["accuracy"])
+    return {
+        "folds": folds,
+        "accuracy": round(sum(accuracies) / len(accuracies), 3) if accuracies else 0.0,
+        "fold_accuracies": accuracies,
+    }
+
+
+# Global classifier instance
+_classifier_instance = None
+
+
+def get_guardrail_classifier(model_path: Optional[str] = None) -> GuardrailClassifier:
+    """Load the trained model if present, otherwise train one from the seed examples."""
+    global _classifier_instance
+    if _classifier_instance is None:
+        path = Path(model_path) if model_path else DEFAULT_MODEL_PATH
+        if path.exists():
+            try:
+                _classifier_instance = GuardrailClassifier.load(path)
+                return _classifier_instance
+            except Exception as e:
+                logger.warning(f"Could not load guardrail model {path}: {str(e)}")
+        examples = seed_examples()
+        model = GuardrailClassifier().fit(examples)
+        model.cv_accuracy = cross_validate(examples)["accuracy"]
+        _classifier_instance = model
+    return _classifier_instance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the guardrail classifier")
+    parser.add_argument("--labels", help="JSONL file with labelled examples")
+    parser.add_argument("--db", help="SQLite database used to resolve chat_history_id labels")
+    parser.add_argument("--train", action="store_true", help="Train and save the model")
+    parser.add_argument("--evaluate", action="store_true", help="Report k-fold accuracy")
+    parser.add_argument("--out", default=str(DEFAULT_MODEL_PATH), help="Model output path")
+    parser.add_argument("--folds", type=int, default=5)
+    args = parser.parse_args()
+
+    examples = seed_examples()
+    if args.labels:
+        examples.extend(load_labelled_examples(Path(args.labels), args.db))
+
+    if args.evaluate or not args.train:
+        print(json.dumps(cross_validate(examples, folds=args.folds), indent=2))
+    if args.train:
+        model = GuardrailClassifier().fit(examples)
+        model.cv_accuracy = cross_validate(examples, folds=args.folds)["accuracy"]
+        model.save(Path(args.out))
+        if not model.is_trusted():
+            print(f"Cross-validated accuracy {model.cv_accuracy} is below {MIN_CV_ACCURACY}; "
+                  "/chat will not short-circuit with this model")
+        print(json.dumps(evaluate(model, examples), indent=2))
+        print(f"Model saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1023 @@
+"""
+Migrations - Versioned schema changes for the SQLite database
+
+Each step runs exactly once, in order, inside its own transaction, and is
+recorded in schema_version. Startup only compares the recorded version with
+the latest known step, so the cost stays constant however many migrations
+accumulate. Steps are written to adopt databases created by the pre-migration
+init_db (CREATE ... IF NOT EXISTS, column checks) so upgrades are seamless.
+
+To add a schema change, append a function to MIGRATIONS; never edit or reorder
+steps that have shipped.
+
+CLI:
+    python -m app.migrations --db data/preppulse.db            # apply pending steps
+    python -m app.migrations --db data/preppulse.db --status   # show applied/pending
+"""
+import argparse
+import hashlib
+import logging
+import sqlite3
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def _m001_baseline(conn):
+    """Tables created by the original init_db."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS first_login (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL UNIQUE,
+            completed INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS onboarding_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL UNIQUE,
+            department TEXT NOT NULL,
+            problem_solving INTEGER NOT NULL,
+            resume_ready INTEGER NOT NULL,
+            interview_ready INTEGER NOT NULL,
+            consistency INTEGER NOT NULL,
+            overall_score REAL NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS skill_checklists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL UNIQUE,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS mock_tests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            test_name TEXT NOT NULL,
+            source TEXT NOT NULL,
+            score REAL NOT NULL,
+            max_score REAL NOT NULL,
+            date_taken TEXT NOT NULL,
+            notes TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resumes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_content TEXT,
+            analysis_data TEXT,
+            ats_score REAL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            name TEXT NOT NULL,
+            color TEXT NOT NULL DEFAULT '#FF6B35',
+            position INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS habit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_id INTEGER NOT NULL,
+            email TEXT NOT NULL,
+            log_date TEXT NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(habit_id, log_date),
+            FOREIGN KEY (habit_id) REFERENCES habits(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            user_message TEXT NOT NULL,
+            assistant_response TEXT NOT NULL,
+            context TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resources (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            uploader_name TEXT NOT NULL,
+            title TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            year_of_engineering TEXT NOT NULL,
+            academic_year TEXT NOT NULL,
+            description TEXT,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_hash TEXT,
+            file_size INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            uploaded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            reviewed_at TEXT,
+            reviewed_by TEXT
+        )
+        """
+    )
+    # Databases created before resource hashing lack these columns.
+    res_columns = {
+        row[1] for row in conn.execute("PRAGMA table_info(resources)").fetchall()
+    }
+    if "file_hash" not in res_columns:
+        conn.execute("ALTER TABLE resources ADD COLUMN file_hash TEXT")
+    if "file_size" not in res_columns:
+        conn.execute("ALTER TABLE resources ADD COLUMN file_size INTEGER")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_resources_file_hash ON resources(file_hash)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            resource_id INTEGER NOT NULL,
+            commenter_email TEXT NOT NULL,
+            commenter_name TEXT NOT NULL,
+            comment TEXT NOT NULL,
+            is_admin INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ai_refinements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            resource_id INTEGER NOT NULL,
+            user_email TEXT NOT NULL,
+            summary TEXT,
+            questions_data TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            completed_at TEXT,
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
+        )
+        """
+    )
+
+
+def _m002_chat_history_keyset_index(conn):
+    # Serves per-user history scans ordered by (created_at, id) without a sort.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_history_email_created ON chat_history(email, created_at)"
+    )
+
+
+def _m003_chat_history_fts(conn):
+    """
+    Full-text index over chat_history, kept in sync by triggers.
+    Each row carries an owner token ('o' + hex(email)) so searches intersect
+    with one user's postings instead of filtering every user's matches.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history_fts'"
+    ).fetchone()
+    if exists:
+        # Created by init_db before migrations existed.
+        return
+    try:
+        conn.execute(
+            """
+            CREATE VIEW IF NOT EXISTS chat_history_fts_source AS
+            SELECT id, 'o' || hex(email) AS owner, user_message, assistant_response
+            FROM chat_history
+            """
+        )
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE chat_history_fts USING fts5(
+                owner, user_message, assistant_response,
+                content='chat_history_fts_source', content_rowid='id',
+                tokenize='porter unicode61'
+            )
+            """
+        )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; search endpoints report it as unavailable.
+        return
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_fts_ai AFTER INSERT ON chat_history BEGIN
+            INSERT INTO chat_history_fts(rowid, owner, user_message, assistant_response)
+            VALUES (new.id, 'o' || hex(new.email), new.user_message, new.assistant_response);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_fts_ad AFTER DELETE ON chat_history BEGIN
+            INSERT INTO chat_history_fts(chat_history_fts, rowid, owner, user_message, assistant_response)
+            VALUES ('delete', old.id, 'o' || hex(old.email), old.user_message, old.assistant_response);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_fts_au AFTER UPDATE OF email, user_message, assistant_response
+        ON chat_history BEGIN
+            INSERT INTO chat_history_fts(chat_history_fts, rowid, owner, user_message, assistant_response)
+            VALUES ('delete', old.id, 'o' || hex(old.email), old.user_message, old.assistant_response);
+            INSERT INTO chat_history_fts(rowid, owner, user_message, assistant_response)
+            VALUES (new.id, 'o' || hex(new.email), new.user_message, new.assistant_response);
+        END
+        """
+    )
+    conn.execute("INSERT INTO chat_history_fts(chat_history_fts) VALUES ('rebuild')")
+
+
+def _m004_chat_contexts(conn):
+    """
+    Content-addressed store for the per-message chat context blobs.
+    chat_history rows reference a context by sha256 hash; triggers keep
+    ref_count in step with chat_history inserts/deletes and drop unreferenced blobs.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_contexts (
+            hash TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chat_history)").fetchall()}
+    if "context_hash" not in columns:
+        conn.execute("ALTER TABLE chat_history ADD COLUMN context_hash TEXT")
+        # Move legacy inline contexts into the store once.
+        legacy = conn.execute(
+            """
+            SELECT context, COUNT(*) FROM chat_history
+            WHERE context IS NOT NULL AND context != ''
+            GROUP BY context
+            """
+        ).fetchall()
+        for content, ref_count in legacy:
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            conn.execute(
+                """
+                INSERT INTO chat_contexts (hash, content, ref_count) VALUES (?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET ref_count = ref_count + excluded.ref_count
+                """,
+                (digest, content, ref_count),
+            )
+            conn.execute(
+                "UPDATE chat_history SET context_hash = ?, context = NULL WHERE context = ?",
+                (digest, content),
+            )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_ctx_ai AFTER INSERT ON chat_history
+        WHEN new.context_hash IS NOT NULL BEGIN
+            UPDATE chat_contexts SET ref_count = ref_count + 1 WHERE hash = new.context_hash;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS chat_history_ctx_ad AFTER DELETE ON chat_history
+        WHEN old.context_hash IS NOT NULL BEGIN
+            UPDATE chat_contexts SET ref_count = ref_count - 1 WHERE hash = old.context_hash;
+            DELETE FROM chat_contexts WHERE hash = old.context_hash AND ref_count <= 0;
+        END
+        """
+    )
+
+
+def _m005_chat_memory(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_memory (
+            email TEXT PRIMARY KEY,
+            summary TEXT NOT NULL DEFAULT '',
+            summarized_through_id INTEGER NOT NULL DEFAULT 0,
+            summary_tokens INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+def _m006_chat_archive(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            month TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            row_count INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            first_ts TEXT NOT NULL,
+            last_ts TEXT NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(email, month)
+        )
+        """
+    )
+
+
+# Secondary indexes for the per-user and moderation queries in db.py.
+# test_db_query_plans.py guards against queries that fall back to full scans.
+SECONDARY_INDEXES = (
+    ("idx_mock_tests_email_date", "mock_tests(email, date_taken, created_at)"),
+    ("idx_resumes_email_created", "resumes(email, created_at)"),
+    ("idx_habits_email_position", "habits(email, position)"),
+    ("idx_habit_logs_email_date", "habit_logs(email, log_date)"),
+    ("idx_resources_status_uploaded", "resources(status, uploaded_at)"),
+    ("idx_resources_status_reviewed", "resources(status, reviewed_at, uploaded_at)"),
+    ("idx_resources_email_uploaded", "resources(email, uploaded_at)"),
+    ("idx_resource_comments_resource_created", "resource_comments(resource_id, created_at)"),
+    ("idx_ai_refinements_resource_user", "ai_refinements(resource_id, user_email)"),
+    ("idx_ai_refinements_user_created", "ai_refinements(user_email, created_at)"),
+)
+
+
+def _m007_secondary_indexes(conn):
+    for name, target in SECONDARY_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+
+def _m008_background_jobs(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS background_jobs (
+            name TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'pending',
+            cursor INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            started_at TEXT,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT
+        )
+        """
+    )
+
+
+# Tables whose rows reference a file in the blob store through file_hash.
+BLOB_REFERENCING_TABLES = ("resources", "resumes")
+
+
+def _m009_blob_store(conn):
+    """
+    Reference counts for the content-addressed file store (see storage.py).
+    Triggers on every referencing table keep ref_count in step and stamp
+    orphaned_at when the last reference goes away; files themselves are never
+    removed inline, since a concurrent upload of the same bytes may reuse them.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY NOT NULL,
+            size INTEGER,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            orphaned_at TEXT
+        )
+        """
+    )
+    resume_columns = {row[1] for row in conn.execute("PRAGMA table_info(resumes)").fetchall()}
+    if "file_hash" not in resume_columns:
+        conn.execute("ALTER TABLE resumes ADD COLUMN file_hash TEXT")
+    if "file_size" not in resume_columns:
+        conn.execute("ALTER TABLE resumes ADD COLUMN file_size INTEGER")
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO blobs (hash, size, ref_count)
+        SELECT file_hash, MAX(file_size), COUNT(*) FROM (
+            SELECT file_hash, file_size FROM resources WHERE file_hash IS NOT NULL AND file_hash != ''
+            UNION ALL
+            SELECT file_hash, file_size FROM resumes WHERE file_hash IS NOT NULL AND file_hash != ''
+        )
+        GROUP BY file_hash
+        """
+    )
+    for table in BLOB_REFERENCING_TABLES:
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_blob_ai AFTER INSERT ON {table}
+            WHEN new.file_hash IS NOT NULL AND new.file_hash != '' BEGIN
+                INSERT OR IGNORE INTO blobs (hash, size) VALUES (new.file_hash, new.file_size);
+                UPDATE blobs SET ref_count = ref_count + 1, orphaned_at = NULL WHERE hash = new.file_hash;
+            END
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_blob_ad AFTER DELETE ON {table}
+            WHEN old.file_hash IS NOT NULL AND old.file_hash != '' BEGIN
+                UPDATE blobs
+                SET ref_count = ref_count - 1,
+                    orphaned_at = CASE WHEN ref_count <= 1 THEN datetime('now') ELSE NULL END
+                WHERE hash = old.file_hash;
+            END
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_blob_au AFTER UPDATE OF file_hash ON {table}
+            WHEN old.file_hash IS NOT new.file_hash BEGIN
+                UPDATE blobs
+                SET ref_count = ref_count - 1,
+                    orphaned_at = CASE WHEN ref_count <= 1 THEN datetime('now') ELSE NULL END
+                WHERE hash = old.file_hash;
+                INSERT OR IGNORE INTO blobs (hash, size)
+                SELECT new.file_hash, new.file_size WHERE new.file_hash != '';
+                UPDATE blobs SET ref_count = ref_count + 1, orphaned_at = NULL WHERE hash = new.file_hash;
+            END
+            """
+        )
+
+
+def _m010_document_text(conn):
+    """Extracted text per unique file (see document_text.py); pages is a JSON list."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS document_text (
+            file_hash TEXT PRIMARY KEY NOT NULL,
+            status TEXT NOT NULL,
+            method TEXT,
+            page_count INTEGER NOT NULL DEFAULT 0,
+            pages TEXT NOT NULL DEFAULT '[]',
+            char_count INTEGER NOT NULL DEFAULT 0,
+            extract_ms REAL,
+            error TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+
+# Browse/facet indexes for approved-resource search (db.search_approved_resources).
+RESOURCE_SEARCH_INDEXES = (
+    ("idx_resources_browse", "resources(status, reviewed_at)"),
+    ("idx_resources_browse_branch", "resources(status, branch, reviewed_at)"),
+    ("idx_resources_browse_year", "resources(status, year_of_engineering, reviewed_at)"),
+    ("idx_resources_browse_branch_year", "resources(status, branch, year_of_engineering, reviewed_at)"),
+    ("idx_resources_status_subject", "resources(status, subject COLLATE NOCASE)"),
+)
+
+# Extracted PDF text of a resource, flattened from document_text pages.
+_RESOURCE_BODY_SQL = """COALESCE((
+    SELECT group_concat(j.value, ' ')
+    FROM document_text d, json_each(d.pages) j
+    WHERE d.file_hash = {row}.file_hash
+), '')"""
+
+
+def _m011_resources_fts(conn):
+    """
+    Full-text index over approved resources: metadata plus extracted PDF text.
+    Only approved rows are indexed, so search never filters on status. Triggers
+    on resources follow moderation and edits; triggers on document_text fill
+    in the body once background extraction finishes.
+    """
+    # Keyset browsing orders by reviewed_at; give older approvals a value.
+    conn.execute(
+        "UPDATE resources SET reviewed_at = uploaded_at WHERE status = 'approved' AND reviewed_at IS NULL"
+    )
+    for name, target in RESOURCE_SEARCH_INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    try:
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE resources_fts USING fts5(
+                title, subject, description, uploader_name, body,
+                tokenize='porter unicode61'
+            )
+            """
+        )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; resource search falls back to browsing.
+        return
+    new_body = _RESOURCE_BODY_SQL.format(row="new")
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS resources_fts_ai AFTER INSERT ON resources
+        WHEN new.status = 'approved' BEGIN
+            INSERT INTO resources_fts(rowid, title, subject, description, uploader_name, body)
+            VALUES (new.id, new.title, new.subject, new.description, new.uploader_name, {new_body});
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS resources_fts_ad AFTER DELETE ON resources BEGIN
+            DELETE FROM resources_fts WHERE rowid = old.id;
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS resources_fts_au
+        AFTER UPDATE OF status, title, subject, description, uploader_name, file_hash ON resources BEGIN
+            DELETE FROM resources_fts WHERE rowid = old.id;
+            INSERT INTO resources_fts(rowid, title, subject, description, uploader_name, body)
+            SELECT new.id, new.title, new.subject, new.description, new.uploader_name, {new_body}
+            WHERE new.status = 'approved';
+        END
+        """
+    )
+    for event in ("INSERT", "UPDATE"):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS document_text_fts_{event.lower()} AFTER {event} ON document_text BEGIN
+                UPDATE resources_fts SET body = {new_body}
+                WHERE rowid IN (
+                    SELECT id FROM resources WHERE file_hash = new.file_hash AND status = 'approved'
+                );
+            END
+            """
+        )
+    conn.execute(
+        f"""
+        INSERT INTO resources_fts(rowid, title, subject, description, uploader_name, body)
+        SELECT r.id, r.title, r.subject, r.description, r.uploader_name, {_RESOURCE_BODY_SQL.format(row="r")}
+        FROM resources r
+        WHERE r.status = 'approved'
+        """
+    )
+
+
+def _m012_near_duplicates(conn):
+    """MinHash signatures, LSH band buckets and flagged pairs (see near_duplicates.py)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_minhash (
+            resource_id INTEGER PRIMARY KEY,
+            file_hash TEXT,
+            signature BLOB NOT NULL,
+            shingle_count INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_lsh_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            resource_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, resource_id)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_resource_lsh_buckets_resource ON resource_lsh_buckets(resource_id)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_near_duplicates (
+            resource_id INTEGER NOT NULL,
+            duplicate_of INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (resource_id, duplicate_of)
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_resource_near_duplicates_of ON resource_near_duplicates(duplicate_of)"
+    )
+    # A deleted resource, or one whose file was replaced, leaves the index;
+    # a replaced file is re-indexed once its text has been extracted.
+    for name, event in (
+        ("resources_near_dup_ad", "AFTER DELETE ON resources"),
+        ("resources_near_dup_au", "AFTER UPDATE OF file_hash ON resources WHEN old.file_hash IS NOT new.file_hash"),
+    ):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN
+                DELETE FROM resource_minhash WHERE resource_id = old.id;
+                DELETE FROM resource_lsh_buckets WHERE resource_id = old.id;
+                DELETE FROM resource_near_duplicates WHERE resource_id = old.id OR duplicate_of = old.id;
+            END
+            """
+        )
+
+
+def _m013_related_resources(conn):
+    """TF-IDF postings and top-K neighbour lists for "related resources" (see related_resources.py)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_term_df (
+            term TEXT PRIMARY KEY,
+            df INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_term_weights (
+            term TEXT NOT NULL,
+            resource_id INTEGER NOT NULL,
+            weight REAL NOT NULL,
+            PRIMARY KEY (term, resource_id)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_resource_term_weights_resource ON resource_term_weights(resource_id)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_neighbors (
+            resource_id INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (resource_id, neighbor_id)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_resource_neighbors_neighbor ON resource_neighbors(neighbor_id)"
+    )
+    # Only approved resources are recommended; approval and edits re-add them.
+    for name, event in (
+        ("resources_related_ad", "AFTER DELETE ON resources"),
+        ("resources_related_au", "AFTER UPDATE OF status ON resources WHEN new.status != 'approved'"),
+    ):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN
+                DELETE FROM resource_term_weights WHERE resource_id = old.id;
+                DELETE FROM resource_neighbors WHERE resource_id = old.id OR neighbor_id = old.id;
+            END
+            """
+        )
+
+
+# Column prefix in storage_usage for each table that stores user files.
+STORAGE_USAGE_COLUMNS = {"resources": "resource", "resumes": "resume"}
+
+
+def _m014_storage_accounting(conn):
+    """
+    Per-user and site-wide storage totals kept current by triggers, plus a
+    log of garbage-collection runs (see storage_gc.py). storage_usage has one
+    row per uploader and a '*' row with the totals; logical bytes come from
+    file_size, physical bytes (blob_count/blob_bytes, '*' row only) from the
+    deduplicated blobs table.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS storage_usage (
+            owner TEXT PRIMARY KEY,
+            resource_count INTEGER NOT NULL DEFAULT 0,
+            resource_bytes INTEGER NOT NULL DEFAULT 0,
+            resume_count INTEGER NOT NULL DEFAULT 0,
+            resume_bytes INTEGER NOT NULL DEFAULT 0,
+            blob_count INTEGER NOT NULL DEFAULT 0,
+            blob_bytes INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_storage_usage_total ON storage_usage(resource_bytes + resume_bytes)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_blobs_orphaned ON blobs(orphaned_at) WHERE ref_count <= 0"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS storage_gc_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dry_run INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            reclaimed_bytes INTEGER NOT NULL DEFAULT 0,
+            report TEXT,
+            started_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT
+        )
+        """
+    )
+
+    conn.execute("INSERT OR IGNORE INTO storage_usage (owner) VALUES ('*')")
+    for table, column in STORAGE_USAGE_COLUMNS.items():
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO storage_usage (owner)
+            SELECT DISTINCT email FROM {table} WHERE email IS NOT NULL
+            """
+        )
+        conn.execute(
+            f"""
+            UPDATE storage_usage SET {column}_count = t.files, {column}_bytes = t.bytes
+            FROM (
+                SELECT email, COUNT(*) AS files, COALESCE(SUM(file_size), 0) AS bytes
+                FROM {table} GROUP BY email
+            ) AS t
+            WHERE storage_usage.owner = t.email
+            """
+        )
+        conn.execute(
+            f"""
+            UPDATE storage_usage SET
+                {column}_count = (SELECT COUNT(*) FROM {table}),
+                {column}_bytes = (SELECT COALESCE(SUM(file_size), 0) FROM {table})
+            WHERE owner = '*'
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_usage_ai AFTER INSERT ON {table} BEGIN
+                INSERT OR IGNORE INTO storage_usage (owner) VALUES (new.email);
+                UPDATE storage_usage
+                SET {column}_count = {column}_count + 1,
+                    {column}_bytes = {column}_bytes + COALESCE(new.file_size, 0),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE owner IN (new.email, '*');
+            END
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_usage_ad AFTER DELETE ON {table} BEGIN
+                UPDATE storage_usage
+                SET {column}_count = {column}_count - 1,
+                    {column}_bytes = {column}_bytes - COALESCE(old.file_size, 0),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE owner IN (old.email, '*');
+            END
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_usage_au AFTER UPDATE OF email, file_size ON {table}
+            WHEN old.email IS NOT new.email OR old.file_size IS NOT new.file_size BEGIN
+                UPDATE storage_usage
+                SET {column}_count = {column}_count - 1,
+                    {column}_bytes = {column}_bytes - COALESCE(old.file_size, 0)
+                WHERE owner IN (old.email, '*');
+                INSERT OR IGNORE INTO storage_usage (owner) VALUES (new.email);
+                UPDATE storage_usage
+                SET {column}_count = {column}_count + 1,
+                    {column}_bytes = {column}_bytes + COALESCE(new.file_size, 0),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE owner IN (new.email, '*');
+            END
+            """
+        )
+
+    conn.execute(
+        """
+        UPDATE storage_usage SET
+            blob_count = (SELECT COUNT(*) FROM blobs),
+            blob_bytes = (SELECT COALESCE(SUM(size), 0) FROM blobs)
+        WHERE owner = '*'
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS blobs_usage_ai AFTER INSERT ON blobs BEGIN
+            UPDATE storage_usage
+            SET blob_count = blob_count + 1, blob_bytes = blob_bytes + COALESCE(new.size, 0),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE owner = '*';
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS blobs_usage_ad AFTER DELETE ON blobs BEGIN
+            UPDATE storage_usage
+            SET blob_count = blob_count - 1, blob_bytes = blob_bytes - COALESCE(old.size, 0),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE owner = '*';
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS blobs_usage_au AFTER UPDATE OF size ON blobs
+        WHEN old.size IS NOT new.size BEGIN
+            UPDATE storage_usage
+            SET blob_bytes = blob_bytes - COALESCE(old.size, 0) + COALESCE(new.size, 0),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE owner = '*';
+        END
+        """
+    )
+
+
+def _m015_resource_stats(conn):
+    """
+    Download/view counters for resources, written in batches by
+    resource_stats.py: lifetime totals in resource_stats and per-day buckets
+    (UTC 'YYYY-MM-DD') in resource_stats_daily, summed for "popular this week".
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_stats (
+            resource_id INTEGER PRIMARY KEY,
+            downloads INTEGER NOT NULL DEFAULT 0,
+            views INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS resource_stats_daily (
+            day TEXT NOT NULL,
+            resource_id INTEGER NOT NULL,
+            downloads INTEGER NOT NULL DEFAULT 0,
+            views INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, resource_id),
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_resource_stats_daily_resource ON resource_stats_daily(resource_id)"
+    )
+
+
+# (version, name, step). Append only.
+MIGRATIONS = [
+    (1, "baseline", _m001_baseline),
+    (2, "chat_history_keyset_index", _m002_chat_history_keyset_index),
+    (3, "chat_history_fts", _m003_chat_history_fts),
+    (4, "chat_contexts", _m004_chat_contexts),
+    (5, "chat_memory", _m005_chat_memory),
+    (6, "chat_archive", _m006_chat_archive),
+    (7, "secondary_indexes", _m007_secondary_indexes),
+    (8, "background_jobs", _m008_background_jobs),
+    (9, "blob_store", _m009_blob_store),
+    (10, "document_text", _m010_document_text),
+    (11, "resources_fts", _m011_resources_fts),
+    (12, "near_duplicates", _m012_near_duplicates),
+    (13, "related_resources", _m013_related_resources),
+    (14, "storage_accounting", _m014_storage_accounting),
+    (15, "resource_stats", _m015_resource_stats),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _connect(db_path):
+    from .db import open_connection
+
+    # Autocommit mode: transactions are managed explicitly per step below.
+    conn = open_connection(str(db_path))
+    conn.isolation_level = None
+    return conn
+
+
+def current_version(conn) -> int:
+    """Highest applied migration, or 0 for a database that has never been migrated."""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def migrate(db_path, target: int = None) -> list:
+    """Apply pending migrations up to `target` (default: latest). Returns the versions applied."""
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        for version, name, step in MIGRATIONS:
+            if version > target:
+                break
+            # Take the write lock before re-checking so concurrent workers
+            # starting together apply each step exactly once.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                step(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                    (version, name),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            logger.info(f"Applied migration {version:03d}_{name}")
+    finally:
+        conn.close()
+    return applied
+
+
+def ensure_schema(db_path) -> list:
+    """Startup fast path: one version lookup, migrating only when steps are pending."""
+    conn = _connect(db_path)
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    if version >= LATEST_VERSION:
+        return []
+    return migrate(db_path)
+
+
+def migration_status(db_path) -> list:
+    conn = _connect(db_path)
+    try:
+        try:
+            rows = conn.execute("SELECT version, applied_at FROM schema_version").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+    finally:
+        conn.close()
+    applied = {row["version"]: row["applied_at"] for row in rows}
+    return [
+        {"version": version, "name": name, "applied_at": applied.get(version)}
+        for version, name, _ in MIGRATIONS
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply PrepPulse schema migrations")
+    parser.add_argument(
+        "--db",
+        default=str(Path(__file__).resolve().parent.parent / "data" / "preppulse.db"),
+        help="Path to the sqlite database",
+    )
+    parser.add_argument("--to", type=int, default=None, help="Migrate up to this version")
+    parser.add_argument("--status", action="store_true", help="List applied and pending migrations")
+    args = parser.parse_args()
+
+    if args.status:
+        for step in migration_status(args.db):
+            state = step["applied_at"] or "pending"
+            print(f"{step['version']:03d}_{step['name']:<32} {state}")
+        return
+
+    Path(args.db).parent.mkdir(parents=True, exist_ok=True)
+    applied = migrate(args.db, target=args.to)
+    print(f"Applied {len(applied)} migration(s): {applied or 'schema already up to date'}")
+
+
+if __name__ == "__main__":
+    main()
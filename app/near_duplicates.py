@@ -0,0 +1,197 @@
+"""
+Near Duplicates - MinHash/LSH detection of re-uploaded notes
+
+Exact SHA-256 matching misses the same notes re-exported, re-scanned or with
+a new cover page. Each resource's extracted text is reduced to word
+5-shingles and a 128-value MinHash signature whose agreement rate estimates
+Jaccard similarity. Signatures are split into 32 bands of 4 values; every
+band hashes to a bucket in resource_lsh_buckets, so finding candidates costs
+one index lookup per band however many resources exist. Candidates are
+verified against their stored signatures and those at or above the
+threshold are recorded in resource_near_duplicates, which the admin pending
+queue shows as "possible duplicate of ...". Uploads are flagged, never
+blocked.
+
+Indexing runs on the background thread that extracts the upload's text.
+Existing resources: python scripts/index_near_duplicates.py
+"""
+import hashlib
+import logging
+import random
+import re
+from array import array
+from typing import Dict, List, Optional
+
+from .db import get_connection
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+# 32 bands x 4 rows: a pair at Jaccard 0.8 shares a bucket with probability ~1.0,
+# a pair at 0.3 only ~0.23, and false candidates are dropped on verification.
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+# Documents with fewer shingles (e.g. scans without a text layer) are not indexed.
+MIN_SHINGLES = 20
+# Very long documents are reduced to the shingles with the smallest hashes.
+# The selection depends only on the hash, so it is consistent across documents.
+MAX_SHINGLES = 4000
+DEFAULT_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+_WORD_RE = re.compile(r"\w+")
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def shingle_hashes(text: str) -> List[int]:
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) < SHINGLE_SIZE:
+        return []
+    hashes = {
+        _hash64(" ".join(words[i:i + SHINGLE_SIZE]).encode("utf-8")) % _MERSENNE_PRIME
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+    return sorted(hashes)[:MAX_SHINGLES]
+
+
+def minhash_signature(shingles: List[int]) -> List[int]:
+    p = _MERSENNE_PRIME
+    return [min((a * x + b) % p for x in shingles) for a, b in _PERMUTATIONS]
+
+
+def band_buckets(signature: List[int]) -> List[int]:
+    """One signed 64-bit bucket id per band (fits an SQLite INTEGER)."""
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(array("Q", values).tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "big", signed=True))
+    return buckets
+
+
+def estimate_similarity(left: List[int], right: List[int]) -> float:
+    return sum(1 for a, b in zip(left, right) if a == b) / NUM_PERM
+
+
+def _pack(signature: List[int]) -> bytes:
+    return array("Q", signature).tobytes()
+
+
+def _unpack(blob: bytes) -> List[int]:
+    values = array("Q")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+def index_resource_text(db_path: str, resource_id: int, file_hash: Optional[str], text: str,
+                        threshold: float = DEFAULT_THRESHOLD) -> Optional[List[Dict]]:
+    """
+    (Re)index one resource and flag near-duplicates of it among already
+    indexed resources. Returns the flagged matches, best first, or None when
+    the text is too short to index.
+    """
+    shingles = shingle_hashes(text)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    signature = minhash_signature(shingles)
+    buckets = band_buckets(signature)
+
+    with get_connection(db_path) as conn:
+        candidates = set()
+        for band, bucket in enumerate(buckets):
+            rows = conn.execute(
+                "SELECT resource_id FROM resource_lsh_buckets WHERE band = ? AND bucket = ?",
+                (band, bucket),
+            ).fetchall()
+            candidates.update(row[0] for row in rows)
+        candidates.discard(resource_id)
+
+        matches = []
+        for candidate in sorted(candidates):
+            row = conn.execute(
+                "SELECT signature FROM resource_minhash WHERE resource_id = ?", (candidate,)
+            ).fetchone()
+            if not row:
+                continue
+            similarity = estimate_similarity(signature, _unpack(row[0]))
+            if similarity >= threshold:
+                matches.append({"duplicate_of": candidate, "similarity": round(similarity, 3)})
+
+        conn.execute("DELETE FROM resource_lsh_buckets WHERE resource_id = ?", (resource_id,))
+        conn.execute("DELETE FROM resource_near_duplicates WHERE resource_id = ?", (resource_id,))
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO resource_minhash (resource_id, file_hash, signature, shingle_count)
+            VALUES (?, ?, ?, ?)
+            """,
+            (resource_id, file_hash, _pack(signature), len(shingles)),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO resource_lsh_buckets (band, bucket, resource_id) VALUES (?, ?, ?)",
+            [(band, bucket, resource_id) for band, bucket in enumerate(buckets)],
+        )
+        conn.executemany(
+            """
+            INSERT INTO resource_near_duplicates (resource_id, duplicate_of, similarity)
+            VALUES (?, ?, ?)
+            """,
+            [(resource_id, m["duplicate_of"], m["similarity"]) for m in matches],
+        )
+        conn.commit()
+
+    matches.sort(key=lambda m: m["similarity"], reverse=True)
+    if matches:
+        logger.info(f"Resource {resource_id} looks like a near-duplicate of {[m['duplicate_of'] for m in matches]}")
+    return matches
+
+
+def index_when_extracted(db_path: str, resource_id: int, threshold: float = DEFAULT_THRESHOLD):
+    """on_ready callback for document_text.schedule_text_extraction."""
+    def _on_ready(record: Dict):
+        if record and record.get("status") == "ok":
+            index_resource_text(db_path, resource_id, record["file_hash"], record["text"], threshold)
+    return _on_ready
+
+
+def index_missing_resources(db_path: str, blob_dir: str, threshold: float = DEFAULT_THRESHOLD,
+                            batch_size: int = 100) -> Dict[str, int]:
+    """Index every non-rejected resource that has no signature yet, in id order."""
+    from .document_text import get_or_extract_text
+    from .storage import stored_file_path
+
+    indexed, flagged, skipped, cursor = 0, 0, 0, 0
+    while True:
+        with get_connection(db_path) as conn:
+            rows = conn.execute(
+                """
+                SELECT r.id, r.file_hash, r.file_path
+                FROM resources r
+                LEFT JOIN resource_minhash m ON m.resource_id = r.id
+                WHERE r.id > ? AND r.status != 'rejected' AND m.resource_id IS NULL
+                ORDER BY r.id
+                LIMIT ?
+                """,
+                (cursor, batch_size),
+            ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            cursor = row["id"]
+            path = stored_file_path(blob_dir, row["file_hash"], row["file_path"])
+            text = get_or_extract_text(db_path, row["file_hash"], path)
+            matches = index_resource_text(db_path, row["id"], row["file_hash"], text, threshold)
+            if matches is None:
+                skipped += 1
+                continue
+            indexed += 1
+            flagged += 1 if matches else 0
+    return {"indexed": indexed, "flagged": flagged, "skipped": skipped}
@@ -0,0 +1,66 @@
+"""
+Prompt Guard - Single-pass prompt-injection scanner for chatbot inputs
+
+All injection patterns are compiled once into one alternation. A cheap literal
+prefilter rejects the common case (text containing none of the trigger words)
+before the regex engine runs, and verdicts are cached so the same context blob
+sent with every message is only scanned once.
+
+Benchmark: python scripts/bench_prompt_guard.py
+"""
+import re
+from functools import lru_cache
+
+# Prompt-injection hardening for chatbot inputs. Patterns run against
+# normalized, case-folded text.
+_PROMPT_INJECTION_PATTERNS = [
+    r"ignore\s+(all\s+)?(previous|prior|above)\s+instructions",
+    r"disregard\s+(all\s+)?(previous|prior|above)\s+instructions",
+    r"you\s+are\s+now",
+    r"act\s+as\s+(?!a\s+student|a\s+tutor)",
+    r"developer\s+message|system\s+prompt|hidden\s+prompt",
+    r"reveal\s+(your\s+)?(instructions|system\s+prompt|policies)",
+    r"jailbreak|do\s+anything\s+now|dan\b",
+    r"bypass\s+(safety|guardrails|polic(y|ies))",
+    r"tool\s*call|function\s*call|execute\s+command",
+    r"print\s+.*(api\s*key|token|secret|password)",
+    r"base64\s+decode|rot13|caesar\s+cipher",
+]
+
+# Every pattern above needs at least one of these literals to match, so text
+# without any of them cannot be an injection attempt. Keep in sync when adding
+# patterns.
+_PREFILTER_LITERALS = (
+    "ignore", "disregard", "you", "act", "developer", "system", "hidden",
+    "reveal", "jailbreak", "anything", "dan", "bypass", "tool", "function",
+    "execute", "print", "base64", "rot13", "caesar",
+)
+
+_INJECTION_RE = re.compile("|".join(f"(?:{p})" for p in _PROMPT_INJECTION_PATTERNS), re.IGNORECASE)
+_CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_chat_text(value: str, max_len: int = 4000) -> str:
+    """Normalize and bound user-controlled text before using it in prompts."""
+    text = str(value or "")
+    text = _CONTROL_CHARS_RE.sub("", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return text[:max_len]
+
+
+@lru_cache(maxsize=256)
+def _scan(text: str) -> bool:
+    # casefold() (unlike lower()) maps look-alikes such as the long s "ſ" to
+    # plain letters, so the literal prefilter cannot be sidestepped with them.
+    normalized = normalize_chat_text(text, max_len=6000).casefold()
+    if not any(literal in normalized for literal in _PREFILTER_LITERALS):
+        return False
+    return _INJECTION_RE.search(normalized) is not None
+
+
+def is_prompt_injection_attempt(text: str) -> bool:
+    """Return True for high-confidence prompt-injection attempts."""
+    if not text:
+        return False
+    return _scan(str(text))
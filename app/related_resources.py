@@ -0,0 +1,288 @@
+"""
+Related Resources - Precomputed "related notes" for approved resources
+
+Each approved resource is described by a TF-IDF vector over its title,
+subject, description and extracted text (title and subject terms count
+extra). Vectors are pruned to their strongest MAX_TERMS terms and stored as
+postings in resource_term_weights, and the top-K cosine neighbours of every
+resource are kept in resource_neighbors. Serving "related" is a primary-key
+range read of at most K rows; nothing is computed per request.
+
+rebuild_related_resources() recomputes document frequencies, vectors and
+neighbour lists for the whole collection (python
+scripts/build_related_resources.py, e.g. nightly). Between rebuilds,
+approving or editing resources queues them with schedule_related_refresh();
+each is re-vectorised against the stored document frequencies, scored
+through the postings of its own terms only, and slotted into the neighbour
+lists of the resources it beats. Resources leaving the approved
+set are dropped from every list by triggers (see migrations); lists that
+lose an entry that way are topped up by the next rebuild.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .db import get_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 10
+MAX_TERMS = 200
+# Pairs below this cosine share little more than boilerplate and are not listed.
+MIN_SCORE = 0.05
+FIELD_WEIGHTS = (("title", 3), ("subject", 2), ("description", 1))
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9]{2,}")
+_STOPWORDS = frozenset(
+    """
+    the and for are but not you all any can had her was one our out has him his how man new now old
+    see two way who its did get may use she too via per also been from have into more most much
+    must only other over some such than that their them then there these they this those very what
+    when where which while will with would your about above after again being below between both
+    each during further here just same should under until upon were whom why yet let etc page
+    """.split()
+)
+
+_refresh_lock = threading.Lock()
+# (db_path, blob_dir, top_k) -> resource ids waiting for a refresh, oldest first.
+_refresh_queue: Dict[Tuple[str, str, int], Dict[int, None]] = {}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOPWORDS]
+
+
+def document_terms(resource: Dict, body: str) -> Counter:
+    """Weighted term counts for one resource: metadata fields boosted, then the body."""
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(resource.get(field) or ""):
+            counts[term] += weight
+    counts.update(tokenize(body))
+    return counts
+
+
+def _idf(df: int, n_docs: int) -> float:
+    return math.log((1 + n_docs) / (1 + df)) + 1.0
+
+
+def tfidf_vector(counts: Counter, df: Dict[str, int], n_docs: int) -> Dict[str, float]:
+    """Sublinear-tf TF-IDF, pruned to the MAX_TERMS heaviest terms and L2-normalised."""
+    weights = {
+        term: (1.0 + math.log(count)) * _idf(df.get(term, 0), n_docs)
+        for term, count in counts.items()
+    }
+    top = sorted(weights.items(), key=lambda item: item[1], reverse=True)[:MAX_TERMS]
+    norm = math.sqrt(sum(w * w for _, w in top))
+    if not norm:
+        return {}
+    return {term: w / norm for term, w in top}
+
+
+def _top_neighbors(scores: Dict[int, float], top_k: int) -> List[Tuple[int, float]]:
+    ranked = heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
+    return [(rid, round(score, 4)) for rid, score in ranked if score >= MIN_SCORE]
+
+
+def _approved_resources(conn, resource_id: Optional[int] = None):
+    query = (
+        "SELECT r.id, r.title, r.subject, r.description, r.file_hash, r.file_path, r.status "
+        "FROM resources r WHERE r.status = 'approved'"
+    )
+    if resource_id is not None:
+        return conn.execute(query + " AND r.id = ?", (resource_id,)).fetchall()
+    return conn.execute(query + " ORDER BY r.id").fetchall()
+
+
+def _resource_body(db_path: str, blob_dir: str, row) -> str:
+    from .document_text import get_or_extract_text
+    from .storage import stored_file_path
+
+    if not row["file_path"] and not row["file_hash"]:
+        return ""
+    return get_or_extract_text(
+        db_path, row["file_hash"], stored_file_path(blob_dir, row["file_hash"], row["file_path"])
+    )
+
+
+def rebuild_related_resources(db_path: str, blob_dir: str, top_k: int = DEFAULT_TOP_K) -> Dict[str, int]:
+    """Recompute document frequencies, vectors and neighbour lists for all approved resources."""
+    with get_connection(db_path) as conn:
+        rows = [dict(row) for row in _approved_resources(conn)]
+
+    # Pass 1: document frequencies. Bodies come from the document_text cache
+    # and are re-read in pass 2 so only one document is held at a time.
+    df = Counter()
+    for row in rows:
+        df.update(document_terms(row, _resource_body(db_path, blob_dir, row)).keys())
+    n_docs = len(rows)
+
+    # Pass 2: pruned vectors and an in-memory inverted index over them.
+    vectors: Dict[int, Dict[str, float]] = {}
+    postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+    for row in rows:
+        vector = tfidf_vector(document_terms(row, _resource_body(db_path, blob_dir, row)), df, n_docs)
+        vectors[row["id"]] = vector
+        for term, weight in vector.items():
+            postings[term].append((row["id"], weight))
+
+    neighbors = {}
+    for rid, vector in vectors.items():
+        scores: Dict[int, float] = defaultdict(float)
+        for term, weight in vector.items():
+            for other, other_weight in postings[term]:
+                scores[other] += weight * other_weight
+        scores.pop(rid, None)
+        neighbors[rid] = _top_neighbors(scores, top_k)
+
+    with get_connection(db_path) as conn:
+        conn.execute("DELETE FROM resource_term_df")
+        conn.execute("DELETE FROM resource_term_weights")
+        conn.execute("DELETE FROM resource_neighbors")
+        conn.executemany("INSERT INTO resource_term_df (term, df) VALUES (?, ?)", df.items())
+        conn.executemany(
+            "INSERT INTO resource_term_weights (term, resource_id, weight) VALUES (?, ?, ?)",
+            ((term, rid, weight) for rid, vector in vectors.items() for term, weight in vector.items()),
+        )
+        conn.executemany(
+            "INSERT INTO resource_neighbors (resource_id, neighbor_id, score) VALUES (?, ?, ?)",
+            ((rid, other, score) for rid, pairs in neighbors.items() for other, score in pairs),
+        )
+        conn.commit()
+
+    linked = sum(1 for pairs in neighbors.values() if pairs)
+    logger.info(f"Related resources rebuilt: {n_docs} resources, {len(df)} terms, {linked} with neighbours")
+    return {"resources": n_docs, "terms": len(df), "with_neighbors": linked}
+
+
+def _chunks(items: List, size: int = 500) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _drop_resource(conn, resource_id: int):
+    conn.execute("DELETE FROM resource_term_weights WHERE resource_id = ?", (resource_id,))
+    conn.execute(
+        "DELETE FROM resource_neighbors WHERE resource_id = ? OR neighbor_id = ?", (resource_id, resource_id)
+    )
+
+
+def refresh_resource(db_path: str, blob_dir: str, resource_id: int, top_k: int = DEFAULT_TOP_K) -> List[Tuple[int, float]]:
+    """
+    Re-vectorise one resource and update its neighbour list and the lists it
+    now belongs in. Returns the resource's new neighbours.
+    """
+    with get_connection(db_path) as conn:
+        rows = _approved_resources(conn, resource_id)
+    if not rows:
+        with get_connection(db_path) as conn:
+            _drop_resource(conn, resource_id)
+            conn.commit()
+        return []
+    row = dict(rows[0])
+    counts = document_terms(row, _resource_body(db_path, blob_dir, row))
+
+    with get_connection(db_path) as conn:
+        df = {}
+        for chunk in _chunks(list(counts)):
+            placeholders = ",".join("?" * len(chunk))
+            df.update(conn.execute(
+                f"SELECT term, df FROM resource_term_df WHERE term IN ({placeholders})", chunk
+            ).fetchall())
+        n_docs = conn.execute("SELECT COUNT(*) FROM resources WHERE status = 'approved'").fetchone()[0]
+        # Count this resource into the frequencies it is scored against; they
+        # are otherwise as of the last rebuild.
+        vector = tfidf_vector(counts, {term: df.get(term, 0) + 1 for term in counts}, n_docs)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term, weight in vector.items():
+            for other, other_weight in conn.execute(
+                "SELECT resource_id, weight FROM resource_term_weights WHERE term = ?", (term,)
+            ):
+                if other != resource_id:
+                    scores[other] += weight * other_weight
+        neighbors = _top_neighbors(scores, top_k)
+
+        _drop_resource(conn, resource_id)
+        conn.executemany(
+            "INSERT INTO resource_term_weights (term, resource_id, weight) VALUES (?, ?, ?)",
+            ((term, resource_id, weight) for term, weight in vector.items()),
+        )
+        conn.executemany(
+            "INSERT INTO resource_neighbors (resource_id, neighbor_id, score) VALUES (?, ?, ?)",
+            ((resource_id, other, score) for other, score in neighbors),
+        )
+
+        # Scores are symmetric: join the lists of resources this one now outranks.
+        candidates = [(other, round(score, 4)) for other, score in scores.items() if score >= MIN_SCORE]
+        for chunk in _chunks(candidates):
+            placeholders = ",".join("?" * len(chunk))
+            current = {
+                rid: (count, lowest)
+                for rid, count, lowest in conn.execute(
+                    f"""
+                    SELECT resource_id, COUNT(*), MIN(score) FROM resource_neighbors
+                    WHERE resource_id IN ({placeholders}) GROUP BY resource_id
+                    """,
+                    [other for other, _ in chunk],
+                )
+            }
+            for other, score in chunk:
+                count, lowest = current.get(other, (0, 0.0))
+                if count >= top_k and score <= lowest:
+                    continue
+                conn.execute(
+                    "INSERT INTO resource_neighbors (resource_id, neighbor_id, score) VALUES (?, ?, ?)",
+                    (other, resource_id, score),
+                )
+                if count >= top_k:
+                    conn.execute(
+                        """
+                        DELETE FROM resource_neighbors
+                        WHERE resource_id = ? AND neighbor_id NOT IN (
+                            SELECT neighbor_id FROM resource_neighbors
+                            WHERE resource_id = ? ORDER BY score DESC, neighbor_id LIMIT ?
+                        )
+                        """,
+                        (other, other, top_k),
+                    )
+        conn.commit()
+    return neighbors
+
+
+def schedule_related_refresh(db_path: str, blob_dir: str, resource_ids: Iterable[int],
+                             top_k: int = DEFAULT_TOP_K):
+    """
+    Queue resources for refresh_resource on a background thread. One thread
+    per database drains the queue, so a bulk approval is a single pass and a
+    resource queued again before its turn is refreshed once.
+    """
+    key = (db_path, blob_dir, top_k)
+    with _refresh_lock:
+        queue = _refresh_queue.get(key)
+        start = queue is None
+        if start:
+            queue = _refresh_queue[key] = {}
+        for resource_id in resource_ids:
+            queue[int(resource_id)] = None
+    if not start:
+        return
+
+    def _run():
+        while True:
+            with _refresh_lock:
+                if not queue:
+                    del _refresh_queue[key]
+                    return
+                resource_id = next(iter(queue))
+                del queue[resource_id]
+            try:
+                refresh_resource(db_path, blob_dir, resource_id, top_k)
+            except Exception as e:
+                logger.error(f"Error refreshing related resources for {resource_id}: {str(e)}")
+
+    threading.Thread(target=_run, name="related-resources", daemon=True).start()
@@ -0,0 +1,170 @@
+"""
+Resource Stats - Buffered download/view counters for resources
+
+Serving a file must not cost a database write, so record_download() only
+bumps an in-memory counter. Counters are split over COUNTER_SHARDS dicts,
+each behind its own lock, and every thread sticks to one shard, so concurrent
+downloads rarely wait on each other. A flusher thread swaps the shards out
+every few seconds and applies the totals in one transaction
+(db.add_resource_stat_counts): lifetime counts in resource_stats and per-day
+buckets in resource_stats_daily, from which db.get_popular_resources sums the
+"most downloaded this week" ranking. Counts are bucketed by the UTC day they
+happened on, not the day they were flushed.
+
+A failed flush puts its counts back for the next attempt, and the counters
+are flushed one last time at interpreter exit, so only a hard kill loses the
+last few seconds. Each worker process keeps its own counters; the flush adds
+to the stored totals, so several workers sum correctly.
+
+Enabled from create_app with RESOURCE_STATS_ENABLED; without running counters
+record_download() is a no-op.
+"""
+import atexit
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COUNTER_SHARDS = 8
+DEFAULT_FLUSH_INTERVAL_S = 5.0
+# Daily buckets are only needed for rolling rankings; lifetime totals are kept separately.
+DAILY_RETENTION_DAYS = 90
+
+_shard_ids = itertools.count()
+_local = threading.local()
+
+
+def _utc_day(offset_days: int = 0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(days=offset_days)).strftime("%Y-%m-%d")
+
+
+class ResourceCounters:
+    """Sharded in-memory download/view counts, flushed to SQLite by a background thread."""
+
+    def __init__(self, db_path: str, flush_interval_s: float = DEFAULT_FLUSH_INTERVAL_S,
+                 shards: int = COUNTER_SHARDS):
+        self.db_path = db_path
+        self.flush_interval = flush_interval_s
+        self._locks = [threading.Lock() for _ in range(shards)]
+        # Per shard: (resource_id, day) -> [downloads, views]
+        self._counts = [{} for _ in range(shards)]
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-stats", daemon=True)
+        self._pruned_day = None
+        self.flushes = 0
+        self.flushed_events = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def record(self, resource_id: int, view: bool = False):
+        shard = getattr(_local, "shard", None)
+        if shard is None:
+            shard = _local.shard = next(_shard_ids)
+        index = shard % len(self._locks)
+        key = (int(resource_id), _utc_day())
+        with self._locks[index]:
+            counts = self._counts[index]
+            pair = counts.get(key)
+            if pair is None:
+                pair = counts[key] = [0, 0]
+            pair[1 if view else 0] += 1
+
+    def _drain(self) -> Dict[Tuple[int, str], Tuple[int, int]]:
+        merged: Dict[Tuple[int, str], Tuple[int, int]] = {}
+        for index, lock in enumerate(self._locks):
+            with lock:
+                counts, self._counts[index] = self._counts[index], {}
+            for key, (downloads, views) in counts.items():
+                previous = merged.get(key, (0, 0))
+                merged[key] = (previous[0] + downloads, previous[1] + views)
+        return merged
+
+    def _restore(self, merged: Dict[Tuple[int, str], Tuple[int, int]]):
+        with self._locks[0]:
+            counts = self._counts[0]
+            for key, (downloads, views) in merged.items():
+                pair = counts.setdefault(key, [0, 0])
+                pair[0] += downloads
+                pair[1] += views
+
+    def pending(self) -> int:
+        """Events recorded but not yet flushed."""
+        total = 0
+        for index, lock in enumerate(self._locks):
+            with lock:
+                total += sum(downloads + views for downloads, views in self._counts[index].values())
+        return total
+
+    def flush(self) -> int:
+        """Write everything recorded so far. Returns the number of events flushed."""
+        from .db import add_resource_stat_counts
+
+        with self._flush_lock:
+            merged = self._drain()
+            if not merged:
+                return 0
+            today = _utc_day()
+            prune_before = _utc_day(-DAILY_RETENTION_DAYS) if self._pruned_day != today else None
+            try:
+                add_resource_stat_counts(self.db_path, merged, prune_before=prune_before)
+            except Exception as e:
+                logger.error(f"Resource stats flush of {len(merged)} counters failed: {str(e)}")
+                self._restore(merged)
+                return 0
+            self._pruned_day = today
+            events = sum(downloads + views for downloads, views in merged.values())
+            self.flushes += 1
+            self.flushed_events += events
+            return events
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flusher thread and flush what is left."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+_counters: Dict[str, ResourceCounters] = {}
+_counters_lock = threading.Lock()
+
+
+def start_resource_stats(db_path: str, **kwargs) -> ResourceCounters:
+    """Start (once) the counters for `db_path`; flushed and stopped at interpreter exit."""
+    with _counters_lock:
+        counters = _counters.get(db_path)
+        if counters is None:
+            counters = ResourceCounters(db_path, **kwargs).start()
+            _counters[db_path] = counters
+            atexit.register(counters.stop)
+        return counters
+
+
+def get_resource_counters(db_path: str) -> Optional[ResourceCounters]:
+    return _counters.get(db_path)
+
+
+def stop_resource_stats(db_path: str):
+    with _counters_lock:
+        counters = _counters.pop(db_path, None)
+    if counters is not None:
+        counters.stop()
+
+
+def record_download(db_path: str, resource_id: int, view: bool = False):
+    """Count a download (or an in-browser view) of a resource; no-op when counters are not running."""
+    counters = _counters.get(db_path)
+    if counters is not None:
+        counters.record(resource_id, view=view)
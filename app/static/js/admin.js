@@ -553,8 +553,12 @@
     const liveEmpty = document.getElementById("liveEmpty");
     const livePagination = document.getElementById("livePagination");
 
+    const pendingBulkBar = document.getElementById("pendingBulkBar");
+    const pendingSelectAll = document.getElementById("pendingSelectAll");
+    const pendingSelectedCount = document.getElementById("pendingSelectedCount");
+
     let pendingPage = 1;
-    const pendingPageSize = 3;
+    const pendingPageSize = 20;
     let livePage = 1;
     const livePageSize = 5;
     const liveResourceCache = {};
@@ -605,12 +609,14 @@
             if (!pending || pending.length === 0) {
                 if (pendingResourcesList) pendingResourcesList.innerHTML = "";
                 if (pendingEmpty) pendingEmpty.hidden = false;
+                if (pendingBulkBar) pendingBulkBar.hidden = true;
                 renderPagination(pendingPagination, pendingMeta, (nextPage) => {
                     loadPendingResources(nextPage);
                 });
                 return;
             }
             if (pendingEmpty) pendingEmpty.hidden = true;
+            if (pendingBulkBar) pendingBulkBar.hidden = false;
 
             if (pendingResourcesList) {
                 pendingResourcesList.innerHTML = pending.map(r => {
@@ -618,6 +624,7 @@
                     return `
                     <div class="pending-resource-item" style="display:flex;flex-direction:column;gap:0;padding:18px 20px;background:rgba(255,255,255,0.03);border:1px solid rgba(255,255,255,0.07);border-radius:14px;margin-bottom:10px;">
                         <div style="display:flex;gap:16px;align-items:center;">
+                            <input type="checkbox" data-pending-select value="${r.id}" style="width:16px;height:16px;cursor:pointer;flex-shrink:0;">
                             <div style="font-size:1.5rem;">📄</div>
                             <div style="flex:1;min-width:0;">
                                 <div style="font-weight:600;color:#fff;font-size:0.95rem;">${esc(r.title)}</div>
@@ -628,6 +635,10 @@
                                     <span style="padding:2px 8px;font-size:0.68rem;border-radius:5px;background:rgba(255,255,255,0.05);color:rgba(255,255,255,0.5);border:1px solid rgba(255,255,255,0.1);font-weight:600;">${esc(r.academic_year)}</span>
                                 </div>
                                 <div style="font-size:0.72rem;color:rgba(255,255,255,0.4);margin-top:4px;">By ${esc(r.uploader_name)} (${esc(r.email)}) · ${formatDate(r.uploaded_at)}</div>
+                                ${(r.near_duplicates || []).map(d => {
+                                    const dupTitle = JSON.stringify(d.title || 'Preview').replace(/"/g, '&quot;');
+                                    return `<div style="margin-top:6px;font-size:0.72rem;color:#ffb86b;">⚠ Possible duplicate of <a href="#" onclick="window.__previewResource(${d.duplicate_of}, ${dupTitle}); return false;" style="color:#ffb86b;text-decoration:underline;">#${d.duplicate_of} ${esc(d.title)}</a> (${esc(d.status)}, ${Math.round(d.similarity * 100)}% similar)</div>`;
+                                }).join("")}
                             </div>
                             <div style="display:flex;flex-direction:column;gap:8px;flex-shrink:0;align-items:flex-end;">
                                 <button onclick="window.__previewResource(${r.id}, ${safeTitle})" style="padding:8px 16px;font-size:0.78rem;font-weight:600;background:rgba(255,255,255,0.06);border:1px solid rgba(255,255,255,0.12);border-radius:8px;color:rgba(255,255,255,0.75);cursor:pointer;transition:all 0.2s;display:inline-flex;align-items:center;gap:6px;"><svg width="13" height="13" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M1 12s4-8 11-8 11 8 11 8-4 8-11 8-11-8-11-8z"/><circle cx="12" cy="12" r="3"/></svg>Preview</button>
@@ -653,12 +664,78 @@
                 }).join("");
             }
 
+            updatePendingSelection();
             renderPagination(pendingPagination, pendingMeta, (nextPage) => {
                 loadPendingResources(nextPage);
             });
         } catch (err) { console.error("Failed to load pending resources:", err); }
     }
 
+    /* ── Bulk moderation ── */
+    function selectedPendingIds() {
+        if (!pendingResourcesList) return [];
+        return Array.from(pendingResourcesList.querySelectorAll("input[data-pending-select]:checked"))
+            .map(box => Number(box.value));
+    }
+
+    function updatePendingSelection() {
+        const boxes = pendingResourcesList
+            ? pendingResourcesList.querySelectorAll("input[data-pending-select]")
+            : [];
+        const selected = selectedPendingIds().length;
+        if (pendingSelectedCount) pendingSelectedCount.textContent = `${selected} selected`;
+        if (pendingSelectAll) pendingSelectAll.checked = boxes.length > 0 && selected === boxes.length;
+        if (pendingBulkBar) {
+            pendingBulkBar.querySelectorAll("button[data-bulk]").forEach(btn => { btn.disabled = selected === 0; });
+        }
+    }
+
+    async function runBulkAction(action) {
+        const ids = selectedPendingIds();
+        if (ids.length === 0) return;
+        const payload = { ids };
+        if (action === "reject" && !confirm(`Reject ${ids.length} resource(s)?`)) return;
+        if (action === "comment") {
+            const text = (prompt(`Feedback for the uploaders of ${ids.length} resource(s):`) || "").trim();
+            if (!text) return;
+            payload.comment = text;
+        }
+        try {
+            const res = await fetch(`/api/admin/resources/bulk/${action}`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify(payload)
+            });
+            const data = await res.json();
+            if (!res.ok) {
+                alert(data.error || "Bulk action failed.");
+                return;
+            }
+            if (data.skipped && data.skipped.length) {
+                alert(`${data.count} done; ${data.skipped.length} were no longer pending and were skipped.`);
+            }
+            loadResourcesAdminPanel();
+        } catch (err) { console.error("Bulk action failed:", err); }
+    }
+
+    if (pendingResourcesList) {
+        pendingResourcesList.addEventListener("change", (e) => {
+            if (e.target.matches("input[data-pending-select]")) updatePendingSelection();
+        });
+    }
+    if (pendingSelectAll) {
+        pendingSelectAll.addEventListener("change", () => {
+            pendingResourcesList.querySelectorAll("input[data-pending-select]")
+                .forEach(box => { box.checked = pendingSelectAll.checked; });
+            updatePendingSelection();
+        });
+    }
+    if (pendingBulkBar) {
+        pendingBulkBar.querySelectorAll("button[data-bulk]").forEach(btn => {
+            btn.addEventListener("click", () => runBulkAction(btn.dataset.bulk));
+        });
+    }
+
     async function loadLiveResources(page = 1) {
         try {
             const res = await fetch(`/api/admin/resources/live?page=${page}&page_size=${livePageSize}`);
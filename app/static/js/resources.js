@@ -16,11 +16,14 @@
     const filterBranch = document.querySelector("[data-filter-branch]");
     const filterYear = document.querySelector("[data-filter-year]");
     const filterSubject = document.querySelector("[data-filter-subject]");
+    const bundleLink = document.querySelector("[data-bundle-download]");
     const statTotal = document.querySelector("[data-total-resources]");
     const statMy = document.querySelector("[data-my-uploads]");
     const statPending = document.querySelector("[data-pending-count]");
 
     let currentTab = "all";
+    let nextCursor = null;
+    const PAGE_SIZE = 30;
 
     // ── File picker ──
     if (filePickBtn && fileInput) {
@@ -128,19 +131,28 @@
     }
 
     // ── Load resources ──
-    async function loadResources() {
-        showLoading();
+    async function loadResources(append = false) {
+        if (!append) showLoading();
+        if (bundleLink && currentTab !== "all") bundleLink.hidden = true;
         
-        let url = currentTab === "mine" ? "/api/resources/mine" : "/api/resources";
+        let url = currentTab === "mine" ? "/api/resources/mine" : "/api/resources/search";
         const params = new URLSearchParams();
 
         if (currentTab === "all") {
             const branch = filterBranch ? filterBranch.value : "";
             const year = filterYear ? filterYear.value : "";
-            const subject = filterSubject ? filterSubject.value.trim() : "";
+            const query = filterSubject ? filterSubject.value.trim() : "";
             if (branch) params.set("branch", branch);
             if (year) params.set("year", year);
-            if (subject) params.set("subject", subject);
+            if (query) params.set("q", query);
+            if (bundleLink) {
+                // The bundle endpoint needs at least one filter, so it never zips the whole library.
+                bundleLink.hidden = !params.toString();
+                bundleLink.href = "/api/resources/bundle?" + params.toString();
+            }
+            params.set("limit", PAGE_SIZE);
+            params.set("facets", "0");
+            if (append && nextCursor) params.set("cursor", nextCursor);
         }
 
         const qs = params.toString();
@@ -149,7 +161,13 @@
         try {
             const res = await fetch(url);
             const data = await res.json();
-            renderResources(data);
+            if (currentTab === "all") {
+                nextCursor = data.has_more ? data.next_cursor : null;
+                renderResources(data.results || [], append);
+            } else {
+                nextCursor = null;
+                renderResources(data);
+            }
         } catch (err) {
             console.error("Failed to load resources:", err);
             if (resourcesList) {
@@ -166,17 +184,20 @@
     }
 
     // ── Render resources ──
-    function renderResources(resources) {
+    function renderResources(resources, append = false) {
         if (!resourcesList) return;
 
-        if (!resources || resources.length === 0) {
+        const loadMore = resourcesList.querySelector("[data-load-more]");
+        if (loadMore) loadMore.remove();
+
+        if (!append && (!resources || resources.length === 0)) {
             resourcesList.innerHTML = "";
             if (resourcesEmpty) resourcesEmpty.hidden = false;
             return;
         }
         if (resourcesEmpty) resourcesEmpty.hidden = true;
 
-        resourcesList.innerHTML = resources.map(r => {
+        const html = resources.map(r => {
             const isMine = currentTab === "mine";
             const statusHtml = isMine ? `
                 <span class="status-badge status-${esc(r.status)}">
@@ -202,7 +223,14 @@
                     Comments
                 </button>` : "";
 
-            const downloadUrl = `/api/resources/${r.id}/download`;
+            const relatedBtn = !isMine ? `
+                <button class="btn-comments-res" onclick="window.__toggleRelated(${r.id})">
+                    <svg width="12" height="12" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><circle cx="18" cy="5" r="3"/><circle cx="6" cy="12" r="3"/><circle cx="18" cy="19" r="3"/><line x1="8.59" y1="13.51" x2="15.42" y2="17.49"/><line x1="15.41" y1="6.51" x2="8.59" y2="10.49"/></svg>
+                    Related
+                </button>` : "";
+
+            // Versioned by content hash so the browser may cache it as immutable.
+            const downloadUrl = `/api/resources/${r.id}/download` + (r.file_hash ? `?v=${r.file_hash}` : "");
             const escapedTitle = esc(r.title).replace(/'/g, "\\'");
 
             return `
@@ -234,13 +262,27 @@
                         <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M21 15v4a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2v-4"/><polyline points="7 10 12 15 17 10"/><line x1="12" y1="15" x2="12" y2="3"/></svg>
                         Download
                     </a>
+                    ${relatedBtn}
                     ${editBtn}
                     ${commentsBtn}
                     ${deleteBtn}
                 </div>
                 ${isMine ? `<div class="resource-comments-section" id="user-comments-${r.id}" hidden></div>` : ""}
+                ${!isMine ? `<div class="resource-comments-section resource-related-section" id="related-${r.id}" hidden></div>` : ""}
             </div>`;
         }).join("");
+
+        if (append) resourcesList.insertAdjacentHTML("beforeend", html);
+        else resourcesList.innerHTML = html;
+
+        if (nextCursor) {
+            resourcesList.insertAdjacentHTML("beforeend", `
+                <div class="resources-load-more" data-load-more>
+                    <button class="btn-preview" type="button">Load more</button>
+                </div>`);
+            resourcesList.querySelector("[data-load-more] button")
+                .addEventListener("click", () => loadResources(true));
+        }
     }
 
     // ── PDF Preview ──
@@ -404,14 +446,37 @@
         } catch (err) { console.error("Load comments failed:", err); }
     }
 
+    // ── Related resources ──
+    window.__toggleRelated = async function (id) {
+        const wrap = document.getElementById(`related-${id}`);
+        if (!wrap) return;
+        wrap.hidden = !wrap.hidden;
+        if (wrap.hidden || wrap.dataset.loaded) return;
+        try {
+            const res = await fetch(`/api/resources/${id}/related`);
+            const data = await res.json();
+            const related = data.related || [];
+            wrap.dataset.loaded = "1";
+            if (related.length === 0) {
+                wrap.innerHTML = '<div class="comments-empty">No related resources yet.</div>';
+                return;
+            }
+            wrap.innerHTML = related.map(r => `
+                <div class="related-item">
+                    <a href="#" onclick="window.__previewResource(${r.id}, '${esc(r.title).replace(/'/g, "\\'")}'); return false;">${esc(r.title)}</a>
+                    <span class="related-meta">${esc(r.subject)} · ${esc(r.branch)} · ${esc(r.year_of_engineering)}</span>
+                </div>`).join('');
+        } catch (err) { console.error("Load related failed:", err); }
+    };
+
     // ── Stats ──
     async function loadStats() {
         try {
             const [allRes, myRes] = await Promise.all([
-                fetch("/api/resources").then(r => r.json()),
+                fetch("/api/resources/search?limit=1").then(r => r.json()),
                 fetch("/api/resources/mine").then(r => r.json()),
             ]);
-            if (statTotal) statTotal.textContent = allRes.length;
+            if (statTotal) statTotal.textContent = allRes.total ?? 0;
             if (statMy) statMy.textContent = myRes.length;
             if (statPending) {
                 const pending = myRes.filter(r => r.status === "pending").length;
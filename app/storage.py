@@ -0,0 +1,181 @@
+"""
+Storage - File helpers for uploaded resources and resumes
+
+Hashing reads files in fixed-size chunks so memory use does not depend on
+file size, and can be throttled for background work that must not starve
+request I/O.
+
+Uploads are staged with stage_upload(): the request stream is copied in
+chunks to a temp file inside the target directory while SHA-256 and size are
+computed, the size limit is enforced as soon as it is crossed, and the file
+is atomically renamed into place only once the caller accepts it (e.g. after
+the duplicate check). Anything not published is removed.
+
+Accepted files live in a content-addressed blob store keyed by SHA-256
+(<BLOB_STORE_DIR>/ab/cdef...), so identical bytes are stored once whoever
+uploads them and under whatever name. Rows in resources and resumes point at
+their blob through file_hash; the blobs table (see migrations) counts those
+references. Legacy per-user files are adopted with a hard link, so moving
+them into the store costs no extra space or copy.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple, Union
+
+HASH_CHUNK_SIZE = 1024 * 1024
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised by stage_upload when the stream exceeds max_bytes."""
+
+
+class StagedUpload:
+    """A fully received upload sitting in a temp file next to its destination."""
+
+    def __init__(self, temp_path: Path, file_hash: str, size: int):
+        self.temp_path = temp_path
+        self.file_hash = file_hash
+        self.size = size
+        self.published_path: Optional[Path] = None
+
+    def publish(self, final_path: Union[str, Path]) -> Path:
+        """Atomically move the upload to final_path (same filesystem, so os.replace is atomic)."""
+        final_path = Path(final_path)
+        os.replace(self.temp_path, final_path)
+        self.published_path = final_path
+        return final_path
+
+    def publish_blob(self, blob_dir: Union[str, Path]) -> Path:
+        """Move the upload into the blob store; if the blob already exists the temp file is dropped."""
+        final_path = blob_path(blob_dir, self.file_hash)
+        try:
+            # A fresh mtime keeps the garbage collector off a blob being reused (see storage_gc).
+            os.utime(final_path)
+        except FileNotFoundError:
+            final_path.parent.mkdir(parents=True, exist_ok=True)
+            return self.publish(final_path)
+        self.discard()
+        self.published_path = final_path
+        return final_path
+
+    def discard(self):
+        if self.published_path is None:
+            try:
+                os.unlink(self.temp_path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.discard()
+        return False
+
+
+def stage_upload(stream: BinaryIO, target_dir: Union[str, Path], max_bytes: Optional[int] = None,
+                 chunk_size: int = UPLOAD_CHUNK_SIZE) -> StagedUpload:
+    """
+    Copy `stream` to a temp file in target_dir, hashing as it goes.
+    Raises UploadTooLarge (after removing the partial file) once more than
+    max_bytes have been read.
+    """
+    target_dir = Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=target_dir, prefix=".upload-", suffix=".part")
+    temp_path = Path(temp_name)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return StagedUpload(temp_path, digest.hexdigest(), size)
+
+
+def blob_path(blob_dir: Union[str, Path], file_hash: str) -> Path:
+    """Location of a blob: two-character fan-out directory, then the rest of the hash."""
+    return Path(blob_dir) / file_hash[:2] / file_hash[2:]
+
+
+def is_blob_path(blob_dir: Union[str, Path], path: Union[str, Path]) -> bool:
+    return Path(blob_dir).resolve() in Path(path).resolve().parents
+
+
+def stored_file_path(blob_dir: Union[str, Path], file_hash: Optional[str], file_path: str) -> str:
+    """Path to serve for a row: its blob when present, else the recorded (legacy) path."""
+    if file_hash:
+        path = blob_path(blob_dir, file_hash)
+        if path.exists():
+            return str(path)
+    return file_path
+
+
+def adopt_file(src: Union[str, Path], blob_dir: Union[str, Path], file_hash: str) -> Path:
+    """
+    Make `src` available as the blob for `file_hash`. Hard-links when possible;
+    falls back to a copy (through a temp file and os.replace) across filesystems.
+    """
+    final_path = blob_path(blob_dir, file_hash)
+    try:
+        # As in publish_blob; a fresh hard link also keeps the legacy file's old mtime.
+        os.utime(final_path)
+        return final_path
+    except FileNotFoundError:
+        pass
+    final_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, final_path)
+    except FileExistsError:
+        pass
+    except OSError:
+        fd, temp_name = tempfile.mkstemp(dir=final_path.parent, prefix=".adopt-", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out, open(src, "rb") as fh:
+                shutil.copyfileobj(fh, out, HASH_CHUNK_SIZE)
+            os.replace(temp_name, final_path)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+    os.utime(final_path)
+    return final_path
+
+
+def hash_file(path: Union[str, Path], chunk_size: int = HASH_CHUNK_SIZE,
+              max_bytes_per_sec: Optional[float] = None) -> Tuple[str, int]:
+    """
+    Stream a file through SHA-256. Returns (hexdigest, size_in_bytes).
+    With max_bytes_per_sec set, sleeps between chunks to cap read throughput.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    started = time.monotonic()
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            if max_bytes_per_sec:
+                ahead = size / max_bytes_per_sec - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    return digest.hexdigest(), size
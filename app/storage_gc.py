@@ -0,0 +1,326 @@
+"""
+Storage GC - Reclaim files no row refers to any more
+
+Deleting or replacing a resource or resume only changes rows: the blobs
+triggers drop the reference count and stamp orphaned_at (see migrations),
+and legacy per-user files stay where they were. collect_garbage()
+reconciles the disk against the database and reports, per category, how
+many files and bytes can be reclaimed:
+
+  orphaned_blobs    blob-store files whose blobs row has no references left
+  untracked_blobs   blob-store files with no blobs row at all (e.g. a crash
+                    between publishing an upload and inserting its row)
+  stale_uploads     temp files left behind by interrupted uploads/adoptions
+  legacy_orphans    files under the legacy data/resources and data/resumes
+                    directories that no row points at
+  document_text     cached extracted text for hashes nothing references
+
+With dry_run=False they are deleted as well. Nothing younger than the grace
+period (by orphaned_at and by file mtime) is touched, so an upload that is
+reusing a blob right now keeps it: StagedUpload.publish_blob() refreshes the
+mtime of a blob it reuses, and the collector moves a blob aside before
+deleting its row and puts it back if it turns out to be in use.
+
+Runs are recorded in storage_gc_runs. Use python scripts/gc_storage.py or
+POST /api/admin/storage/gc.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from .db import get_connection, open_connection
+from .storage import blob_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRACE_SECONDS = 24 * 3600
+CATEGORIES = ("orphaned_blobs", "untracked_blobs", "stale_uploads", "legacy_orphans", "document_text")
+_TEMP_PREFIXES = (".upload-", ".adopt-")
+_GC_SUFFIX = ".gc"
+
+_run_lock = threading.Lock()
+
+
+def _empty_report(dry_run: bool, grace_seconds: int) -> Dict:
+    return {
+        "dry_run": dry_run,
+        "grace_seconds": grace_seconds,
+        "categories": {name: {"files": 0, "bytes": 0} for name in CATEGORIES},
+        "reclaimable_bytes": 0,
+        "errors": [],
+    }
+
+
+def _count(report: Dict, category: str, size: int):
+    report["categories"][category]["files"] += 1
+    report["categories"][category]["bytes"] += size
+    report["reclaimable_bytes"] += size
+
+
+def _is_temp_file(name: str) -> bool:
+    return name.startswith(_TEMP_PREFIXES) and name.endswith(".part")
+
+
+def _remove_blob_if_unused(db_path: str, path: Path, file_hash: str, cutoff: float, cutoff_sql: str) -> bool:
+    """
+    Delete one blob and its (unreferenced, long-orphaned or missing) row.
+    The file is renamed aside first so a concurrent upload either sees no
+    blob and publishes its own copy, or has refreshed the mtime and the
+    file is put back.
+    """
+    aside = path.with_name(path.name + _GC_SUFFIX)
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return False
+    removed = False
+    try:
+        if aside.stat().st_mtime <= cutoff:
+            with open_connection(db_path) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT ref_count, orphaned_at FROM blobs WHERE hash = ?", (file_hash,)).fetchone()
+                unused = row is None or (row["ref_count"] <= 0 and row["orphaned_at"] and row["orphaned_at"] <= cutoff_sql)
+                if unused:
+                    conn.execute("DELETE FROM blobs WHERE hash = ?", (file_hash,))
+                    conn.execute("DELETE FROM document_text WHERE file_hash = ?", (file_hash,))
+                conn.commit()
+            removed = unused
+    finally:
+        if removed:
+            aside.unlink(missing_ok=True)
+        elif not path.exists():
+            os.replace(aside, path)
+        else:
+            # A concurrent upload already published the same bytes again.
+            aside.unlink(missing_ok=True)
+    return removed
+
+
+def _sweep_blob_store(db_path: str, blob_dir: Path, report: Dict, cutoff: float, cutoff_sql: str, dry_run: bool):
+    if not blob_dir.is_dir():
+        return
+    for fan_out in sorted(p for p in blob_dir.iterdir() if p.is_dir() and len(p.name) == 2):
+        # One fan-out directory at a time keeps the known-hash set small.
+        with get_connection(db_path) as conn:
+            known = {
+                row["hash"]: row
+                for row in conn.execute(
+                    "SELECT hash, ref_count, orphaned_at FROM blobs WHERE hash >= ? AND hash < ?",
+                    (fan_out.name, fan_out.name + "\uffff"),
+                )
+            }
+        for path in fan_out.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.is_file() or stat.st_mtime > cutoff:
+                continue
+            name = path.name
+            if _is_temp_file(name) or name.endswith(_GC_SUFFIX):
+                category, file_hash = "stale_uploads", None
+            else:
+                file_hash = fan_out.name + name
+                row = known.get(file_hash)
+                if row is None:
+                    category = "untracked_blobs"
+                elif row["ref_count"] <= 0 and row["orphaned_at"] and row["orphaned_at"] <= cutoff_sql:
+                    category = "orphaned_blobs"
+                else:
+                    continue
+            if not dry_run:
+                try:
+                    if file_hash is None:
+                        path.unlink()
+                    elif not _remove_blob_if_unused(db_path, path, file_hash, cutoff, cutoff_sql):
+                        continue
+                except OSError as e:
+                    report["errors"].append(f"{path}: {e}")
+                    continue
+            _count(report, category, stat.st_size)
+    for path in blob_dir.iterdir():
+        # Uploads are staged in the store root before they are published.
+        if path.is_file() and _is_temp_file(path.name):
+            stat = path.stat()
+            if stat.st_mtime <= cutoff:
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+                _count(report, "stale_uploads", stat.st_size)
+    if not dry_run:
+        # Unreferenced rows whose file is already gone only need the row removed.
+        with get_connection(db_path) as conn:
+            rows = conn.execute(
+                "SELECT hash FROM blobs WHERE ref_count <= 0 AND orphaned_at <= ?", (cutoff_sql,)
+            ).fetchall()
+            for row in rows:
+                if not blob_path(blob_dir, row["hash"]).exists():
+                    conn.execute("DELETE FROM blobs WHERE hash = ? AND ref_count <= 0", (row["hash"],))
+            conn.commit()
+
+
+def _referenced_paths(conn) -> set:
+    return {
+        os.path.realpath(row[0])
+        for row in conn.execute("SELECT file_path FROM resources UNION SELECT file_path FROM resumes")
+        if row[0]
+    }
+
+
+def _sweep_legacy_dirs(db_path: str, legacy_dirs: Iterable[str], blob_dir: Path, report: Dict,
+                       cutoff: float, dry_run: bool):
+    # New rows always point into the blob store, so a snapshot of the legacy
+    # references cannot miss one added during the sweep.
+    with get_connection(db_path) as conn:
+        referenced = _referenced_paths(conn)
+    blob_root = os.path.realpath(blob_dir)
+    for legacy_dir in legacy_dirs:
+        if not os.path.isdir(legacy_dir):
+            continue
+        for dirpath, dirnames, filenames in os.walk(legacy_dir):
+            if os.path.realpath(dirpath) == blob_root:
+                dirnames[:] = []
+                continue
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.realpath(path) in referenced:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    try:
+                        os.unlink(path)
+                    except OSError as e:
+                        report["errors"].append(f"{path}: {e}")
+                        continue
+                # A file hard-linked into the blob store frees nothing on its own.
+                _count(report, "legacy_orphans", stat.st_size if stat.st_nlink == 1 else 0)
+
+
+def _sweep_document_text(db_path: str, report: Dict, cutoff_sql: str, dry_run: bool):
+    where = """
+        created_at <= ? AND NOT EXISTS (
+            SELECT 1 FROM blobs b WHERE b.hash = document_text.file_hash AND b.ref_count > 0
+        )
+    """
+    with get_connection(db_path) as conn:
+        files, size = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(LENGTH(pages)), 0) FROM document_text WHERE {where}",
+            (cutoff_sql,),
+        ).fetchone()
+        if not dry_run and files:
+            conn.execute(f"DELETE FROM document_text WHERE {where}", (cutoff_sql,))
+            conn.commit()
+    report["categories"]["document_text"]["files"] += files
+    report["categories"]["document_text"]["bytes"] += size
+    report["reclaimable_bytes"] += size
+
+
+def collect_garbage(db_path: str, blob_dir: str, legacy_dirs: Iterable[str] = (),
+                    grace_seconds: int = DEFAULT_GRACE_SECONDS, dry_run: bool = True) -> Dict:
+    """Reconcile stored files against the database; see the module docstring for categories."""
+    started = time.time()
+    cutoff = started - grace_seconds
+    cutoff_sql = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(cutoff))
+    report = _empty_report(dry_run, grace_seconds)
+
+    # Text first, so what orphaned blobs had cached is counted under document_text.
+    _sweep_document_text(db_path, report, cutoff_sql, dry_run)
+    _sweep_blob_store(db_path, Path(blob_dir), report, cutoff, cutoff_sql, dry_run)
+    _sweep_legacy_dirs(db_path, legacy_dirs, Path(blob_dir), report, cutoff, dry_run)
+
+    report["elapsed_ms"] = round((time.time() - started) * 1000, 1)
+    verb = "would reclaim" if dry_run else "reclaimed"
+    logger.info(f"Storage GC {verb} {report['reclaimable_bytes']} bytes: {report['categories']}")
+    return report
+
+
+def run_storage_gc(db_path: str, blob_dir: str, legacy_dirs: Iterable[str] = (),
+                   grace_seconds: int = DEFAULT_GRACE_SECONDS, dry_run: bool = True,
+                   run_id: Optional[int] = None) -> Optional[Dict]:
+    """
+    collect_garbage() recorded in storage_gc_runs (continuing run_id when
+    given). Returns None if another collection is already running in this process.
+    """
+    if not _run_lock.acquire(blocking=False):
+        if run_id is not None:
+            _finish_gc_run(db_path, run_id, "skipped", {"error": "another collection is running"})
+        return None
+    try:
+        if run_id is None:
+            run_id = create_gc_run(db_path, dry_run)
+        try:
+            report = collect_garbage(db_path, blob_dir, legacy_dirs, grace_seconds, dry_run)
+            status = "done"
+        except Exception as e:
+            logger.error(f"Storage GC failed: {str(e)}")
+            report, status = {"error": str(e)}, "failed"
+        _finish_gc_run(db_path, run_id, status, report)
+        report["run_id"] = run_id
+        return report
+    finally:
+        _run_lock.release()
+
+
+def create_gc_run(db_path: str, dry_run: bool) -> int:
+    with get_connection(db_path) as conn:
+        cur = conn.execute(
+            "INSERT INTO storage_gc_runs (dry_run, status) VALUES (?, 'running')", (1 if dry_run else 0,)
+        )
+        conn.commit()
+        return cur.lastrowid
+
+
+def _finish_gc_run(db_path: str, run_id: int, status: str, report: Dict):
+    with get_connection(db_path) as conn:
+        conn.execute(
+            """
+            UPDATE storage_gc_runs
+            SET status = ?, report = ?, reclaimed_bytes = ?, finished_at = datetime('now')
+            WHERE id = ?
+            """,
+            (status, json.dumps(report), report.get("reclaimable_bytes", 0), run_id),
+        )
+        conn.commit()
+
+
+def is_gc_running() -> bool:
+    return _run_lock.locked()
+
+
+def start_storage_gc(db_path: str, blob_dir: str, legacy_dirs: Iterable[str] = (),
+                     grace_seconds: int = DEFAULT_GRACE_SECONDS, dry_run: bool = True) -> Optional[int]:
+    """Run a collection on a daemon thread. Returns its run id, or None if one is already running."""
+    if is_gc_running():
+        return None
+    run_id = create_gc_run(db_path, dry_run)
+    legacy_dirs = list(legacy_dirs)
+    threading.Thread(
+        target=run_storage_gc,
+        args=(db_path, blob_dir, legacy_dirs, grace_seconds, dry_run, run_id),
+        name="storage-gc",
+        daemon=True,
+    ).start()
+    return run_id
+
+
+def get_gc_run(db_path: str, run_id: Optional[int] = None) -> Optional[Dict]:
+    """A recorded run (the latest when run_id is None), with its report decoded."""
+    with get_connection(db_path) as conn:
+        if run_id is None:
+            row = conn.execute("SELECT * FROM storage_gc_runs ORDER BY id DESC LIMIT 1").fetchone()
+        else:
+            row = conn.execute("SELECT * FROM storage_gc_runs WHERE id = ?", (run_id,)).fetchone()
+    if not row:
+        return None
+    run = dict(row)
+    run["dry_run"] = bool(run["dry_run"])
+    run["report"] = json.loads(run["report"]) if run["report"] else None
+    return run
@@ -0,0 +1,201 @@
+"""
+Write Queue - Group commit for small, high-frequency SQLite writes
+
+Request threads hand small writes (habit toggles, chat turns, first-login
+records, checklist saves) to a single writer thread through a bounded queue.
+The writer drains whatever arrived within a few milliseconds and applies it
+in one transaction, each write inside its own SAVEPOINT so one failure does
+not sink the batch. Callers get a Future that resolves once the batch has
+committed, so durability is acknowledged without every request paying for
+its own lock acquisition and commit.
+
+Enabled from create_app with WRITE_QUEUE_ENABLED; without a running queue the
+db helpers write directly as before. If the writer thread dies, queued
+callers get an error instead of waiting forever and later writes go direct.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_BATCH_WINDOW_MS = 5
+DEFAULT_MAX_BATCH = 200
+SUBMIT_TIMEOUT_S = 5.0
+# Upper bound on waiting for a submitted write; a healthy batch commits in milliseconds.
+RESULT_TIMEOUT_S = 30.0
+
+_STOP = object()
+
+
+class WriteQueueStopped(RuntimeError):
+    """The writer is stopped (or died) and never attempted the write; it is safe to write directly."""
+
+
+class WriteQueue:
+    """Single writer thread applying queued writes in batched transactions."""
+
+    def __init__(self, db_path: str, max_pending: int = DEFAULT_MAX_PENDING,
+                 batch_window_ms: float = DEFAULT_BATCH_WINDOW_MS,
+                 max_batch: int = DEFAULT_MAX_BATCH):
+        self.db_path = db_path
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        # Held across the _stopped check and the put, so nothing is queued behind _STOP.
+        self._submit_lock = threading.Lock()
+        self._stopped = False
+        self._batch = []
+        self.batches = 0
+        self.writes = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def is_alive(self) -> bool:
+        return not self._stopped and self._thread.is_alive()
+
+    def submit(self, tx: Callable, *args) -> Future:
+        """
+        Queue `tx(conn, *args)` for the next batch. Blocks for up to
+        SUBMIT_TIMEOUT_S when the queue is full (back-pressure) and then
+        raises queue.Full. Raises WriteQueueStopped once the writer is stopped.
+        """
+        future = Future()
+        with self._submit_lock:
+            if self._stopped:
+                raise WriteQueueStopped("write queue is stopped")
+            self._queue.put((tx, args, future), timeout=SUBMIT_TIMEOUT_S)
+        return future
+
+    def stop(self, timeout: float = 10.0):
+        """Flush pending writes and stop the writer thread."""
+        with self._submit_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _run(self):
+        try:
+            self._serve()
+        except BaseException as e:
+            logger.exception(f"Writer for {self.db_path} died: {str(e)}")
+            with self._submit_lock:
+                self._stopped = True
+            # Whatever was mid-batch may or may not have committed; the rest was never tried.
+            for _, _, future in self._batch:
+                if not future.done():
+                    future.set_exception(e)
+            for _, _, future in self._drain():
+                future.set_exception(WriteQueueStopped(f"writer died: {str(e)}"))
+
+    def _serve(self):
+        from .db import open_connection
+
+        conn = open_connection(self.db_path)
+        conn.isolation_level = None
+        try:
+            while True:
+                batch = self._collect(self._queue.get())
+                stop = any(item is _STOP for item in batch)
+                items = [item for item in batch if item is not _STOP]
+                if stop:
+                    # submit() refuses new work once stopped; pick up anything already queued.
+                    items += self._drain()
+                if items:
+                    self._batch = items
+                    self._apply(conn, items)
+                    self._batch = []
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _apply(self, conn, items):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for tx, args, future in items:
+                conn.execute("SAVEPOINT queued_write")
+                try:
+                    results.append((future, tx(conn, *args), None))
+                    conn.execute("RELEASE queued_write")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO queued_write")
+                    conn.execute("RELEASE queued_write")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Write batch of {len(items)} failed: {str(e)}")
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return
+        self.batches += 1
+        self.writes += len(items)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_queues: Dict[str, WriteQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def start_write_queue(db_path: str, **kwargs) -> WriteQueue:
+    """Start (once) the writer for `db_path`; flushed and stopped at interpreter exit."""
+    with _queues_lock:
+        write_queue = _queues.get(db_path)
+        if write_queue is None:
+            write_queue = WriteQueue(db_path, **kwargs).start()
+            _queues[db_path] = write_queue
+            atexit.register(write_queue.stop)
+        return write_queue
+
+
+def get_write_queue(db_path: str) -> Optional[WriteQueue]:
+    return _queues.get(db_path)
+
+
+def stop_write_queue(db_path: str):
+    with _queues_lock:
+        write_queue = _queues.pop(db_path, None)
+    if write_queue is not None:
+        write_queue.stop()
@@ -0,0 +1,30 @@
+"""Move old chat history into compressed per-user monthly archive blobs.
+
+Usage:
+    python scripts/archive_chat_history.py --sqlite data/preppulse.db --days 180
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.chat_archive import DEFAULT_ARCHIVE_AFTER_DAYS, archive_chat_history
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sqlite", default="data/preppulse.db", help="Path to the sqlite database")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", DEFAULT_ARCHIVE_AFTER_DAYS)),
+        help="Archive turns older than this many days",
+    )
+    args = parser.parse_args()
+    stats = archive_chat_history(args.sqlite, older_than_days=args.days)
+    print(f"Archived {stats['rows']} turns across {stats['groups']} user-months")
+
+
+if __name__ == "__main__":
+    main()
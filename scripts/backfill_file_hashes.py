@@ -0,0 +1,40 @@
+"""Hash legacy resources that were uploaded before file_hash existed.
+
+Resumable: progress is stored in the background_jobs table, so the script
+can be interrupted and re-run. The app also runs this job in the background
+on startup unless FILE_HASH_BACKFILL_ENABLED=false.
+
+Usage:
+    python scripts/backfill_file_hashes.py --sqlite data/preppulse.db --max-mbps 8
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.background_jobs import DEFAULT_BATCH_SIZE, run_file_hash_backfill
+from app.migrations import ensure_schema
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sqlite", default="data/preppulse.db", help="Path to the sqlite database")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-mbps", type=float, default=8.0, help="Read throughput cap in MiB/s (0 = unlimited)")
+    args = parser.parse_args()
+
+    ensure_schema(args.sqlite)
+    job = run_file_hash_backfill(
+        args.sqlite,
+        batch_size=args.batch_size,
+        max_bytes_per_sec=args.max_mbps * 1024 * 1024 if args.max_mbps > 0 else None,
+    )
+    if job is None:
+        print("Backfill is already running in another process")
+        return
+    print(f"Backfill {job['status']}: {job['processed']} hashed, {job['failed']} failed, cursor {job['cursor']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Throughput benchmark for the chatbot prompt-injection scanner.
+
+Compares the compiled single-pass scanner against the previous per-pattern
+re.search loop over the benign/malicious corpus, plus a large resume-analysis
+style context blob (the second scan /chat runs on every request).
+
+Usage:
+    python scripts/bench_prompt_guard.py --rounds 200
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import prompt_guard  # noqa: E402
+
+CORPUS_PATH = Path(__file__).parent / "prompt_injection_corpus.json"
+
+
+def reference_scan(text):
+    """The original implementation: one re.search per pattern, every call."""
+    if not text:
+        return False
+    normalized = prompt_guard.normalize_chat_text(text, max_len=6000).lower()
+    return any(
+        re.search(pattern, normalized, flags=re.IGNORECASE)
+        for pattern in prompt_guard._PROMPT_INJECTION_PATTERNS
+    )
+
+
+def load_inputs():
+    corpus = json.loads(CORPUS_PATH.read_text(encoding="utf-8"))
+    inputs = corpus["malicious"] + corpus["benign"] + corpus["known_false_positives"]
+    resume_blob = json.dumps({
+        "ats_score": 68,
+        "suggestions": [
+            {
+                "id": f"sug-{i}",
+                "category": "content",
+                "severity": "minor",
+                "title": "Quantify project impact",
+                "description": "State measurable outcomes such as latency or users served.",
+                "section": "Projects",
+            }
+            for i in range(40)
+        ],
+    })
+    return inputs, resume_blob
+
+
+def bench(fn, inputs, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in inputs:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    return rounds * len(inputs) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    inputs, resume_blob = load_inputs()
+
+    def compiled_uncached(text):
+        return prompt_guard._scan.__wrapped__(str(text)) if text else False
+
+    print(f"Corpus: {len(inputs)} inputs, context blob: {len(resume_blob)} chars")
+    print(f"reference (per-pattern)  : {bench(reference_scan, inputs, args.rounds):>12,.0f} msgs/s")
+    print(f"compiled (uncached)      : {bench(compiled_uncached, inputs, args.rounds):>12,.0f} msgs/s")
+    print(f"compiled (cached)        : {bench(prompt_guard.is_prompt_injection_attempt, inputs, args.rounds):>12,.0f} msgs/s")
+    print(f"reference context blob   : {bench(reference_scan, [resume_blob], args.rounds):>12,.0f} scans/s")
+    print(f"compiled context blob    : {bench(compiled_uncached, [resume_blob], args.rounds):>12,.0f} scans/s")
+    print(f"cached context blob      : {bench(prompt_guard.is_prompt_injection_attempt, [resume_blob], args.rounds):>12,.0f} scans/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Rebuild the "related resources" TF-IDF index and neighbour lists from scratch.
+
+Approving or editing a resource refreshes that resource incrementally; run
+this periodically (e.g. nightly from cron) to recompute document
+frequencies for the whole collection and top up neighbour lists that lost
+entries to rejections or deletions.
+
+Usage:
+    python scripts/build_related_resources.py --sqlite data/preppulse.db --blobs data/blobs
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.migrations import ensure_schema
+from app.related_resources import DEFAULT_TOP_K, rebuild_related_resources
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sqlite", default="data/preppulse.db", help="Path to the sqlite database")
+    parser.add_argument("--blobs", default="data/blobs", help="Path to the blob store")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Neighbours kept per resource")
+    args = parser.parse_args()
+
+    ensure_schema(args.sqlite)
+    started = time.perf_counter()
+    result = rebuild_related_resources(args.sqlite, args.blobs, top_k=args.top_k)
+    print(
+        f"Indexed {result['resources']} resources ({result['terms']} terms), "
+        f"{result['with_neighbors']} with related resources, in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
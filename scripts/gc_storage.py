@@ -0,0 +1,50 @@
+"""Reclaim stored files that no resource or resume refers to any more.
+
+Reports reclaimable files and bytes per category (orphaned and untracked
+blobs, stale upload temp files, unreferenced legacy files, cached text of
+deleted files). Nothing is deleted without --delete, and nothing younger
+than the grace period is touched. Meant to run from cron, e.g. nightly.
+
+Usage:
+    python scripts/gc_storage.py --sqlite data/preppulse.db --blobs data/blobs
+    python scripts/gc_storage.py --sqlite data/preppulse.db --blobs data/blobs --delete
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.migrations import ensure_schema
+from app.storage_gc import run_storage_gc
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sqlite", default="data/preppulse.db", help="Path to the sqlite database")
+    parser.add_argument("--blobs", default="data/blobs", help="Path to the blob store")
+    parser.add_argument(
+        "--legacy-dir", action="append", dest="legacy_dirs",
+        help="Legacy per-user upload directory (repeatable; default data/resources and data/resumes)",
+    )
+    parser.add_argument("--grace-hours", type=float, default=24, help="Leave anything younger than this alone")
+    parser.add_argument("--delete", action="store_true", help="Delete orphans (default: report only)")
+    args = parser.parse_args()
+
+    ensure_schema(args.sqlite)
+    report = run_storage_gc(
+        args.sqlite,
+        args.blobs,
+        args.legacy_dirs or ["data/resources", "data/resumes"],
+        grace_seconds=int(args.grace_hours * 3600),
+        dry_run=not args.delete,
+    )
+    if report is None:
+        print("Another collection is already running")
+        return
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Build the near-duplicate (MinHash/LSH) index for resources uploaded before it existed.
+
+Only resources without a signature are processed, so the script can be
+interrupted and re-run. Text comes from the document_text cache and is
+extracted (and cached) where missing.
+
+Usage:
+    python scripts/index_near_duplicates.py --sqlite data/preppulse.db --blobs data/blobs
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.migrations import ensure_schema
+from app.near_duplicates import DEFAULT_THRESHOLD, index_missing_resources
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sqlite", default="data/preppulse.db", help="Path to the sqlite database")
+    parser.add_argument("--blobs", default="data/blobs", help="Path to the blob store")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Jaccard similarity to flag")
+    args = parser.parse_args()
+
+    ensure_schema(args.sqlite)
+    result = index_missing_resources(args.sqlite, args.blobs, threshold=args.threshold)
+    print(
+        f"Indexed {result['indexed']} resources, {result['flagged']} flagged as near-duplicates, "
+        f"{result['skipped']} skipped (no usable text)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+EXPLAIN QUERY PLAN regression tests for app/db.py.
+
+Every public helper in app/db.py is driven against a small seeded database
+while the SQL it issues is captured through a trace callback. Each captured
+statement is then re-planned, and the test fails if a query that should be
+index-backed falls back to a full table SCAN.
+
+Run with: python -m pytest -q test_db_query_plans.py
+"""
+import re
+import sqlite3
+
+import pytest
+from flask import Flask
+
+from app import db, migrations
+
+# Helpers that do not issue per-user / per-row queries worth planning.
+NOT_PLANNED = {
+    "init_db",
+    "open_connection",
+    "get_connection",
+    "close_request_connections",
+    "admin_run_query",
+    "admin_get_table_names",
+    "admin_get_table_data",
+    "admin_delete_row",
+}
+
+# Whole-table reads that are full scans by design (admin dashboards, aggregates).
+ALLOWED_SCANS = {
+    ("get_leaderboard", "hl"),
+    ("get_leaderboard", "users"),
+    ("get_leaderboard", "habits"),
+    ("admin_get_all_users", "users"),
+    ("admin_get_all_users", "u"),
+    ("admin_get_stats", "users"),
+    ("admin_get_stats", "resumes"),
+    ("admin_get_stats", "mock_tests"),
+    ("admin_get_stats", "habits"),
+    ("admin_get_stats", "first_login"),
+    ("admin_get_stats", "onboarding_responses"),
+    ("get_resource_stats", "resources"),
+    ("get_popular_resources", "p"),
+}
+
+EMAIL = "student@example.com"
+OTHER = "other@example.com"
+
+
+def _workload(path):
+    """(helper name, thunk) pairs covering every planned helper in app/db.py."""
+    return [
+        ("create_user", lambda: db.create_user(path, "Student", EMAIL, "hash")),
+        ("get_user_by_email", lambda: db.get_user_by_email(path, EMAIL)),
+        ("update_user_password", lambda: db.update_user_password(path, EMAIL, "hash2")),
+        ("ensure_first_login_record", lambda: db.ensure_first_login_record(path, EMAIL)),
+        ("get_first_login_record", lambda: db.get_first_login_record(path, EMAIL)),
+        ("set_first_login_completed", lambda: db.set_first_login_completed(path, EMAIL)),
+        ("save_onboarding_response", lambda: db.save_onboarding_response(path, EMAIL, "CS", 3, 3, 3, 3, 3.0)),
+        ("get_onboarding_response", lambda: db.get_onboarding_response(path, EMAIL)),
+        ("save_skill_checklist", lambda: db.save_skill_checklist(path, EMAIL, "{}")),
+        ("get_skill_checklist", lambda: db.get_skill_checklist(path, EMAIL)),
+        ("create_mock_test", lambda: db.create_mock_test(path, EMAIL, "T", "S", 5, 10, "2025-01-02", "")),
+        ("list_mock_tests", lambda: db.list_mock_tests(path, EMAIL)),
+        ("update_mock_test", lambda: db.update_mock_test(path, 1, EMAIL, "T", "S", 6, 10, "2025-01-02", "")),
+        ("delete_mock_test", lambda: db.delete_mock_test(path, 999, EMAIL)),
+        ("save_resume", lambda: db.save_resume(path, EMAIL, "cv.pdf", "/tmp/cv.pdf", "text")),
+        ("get_latest_resume", lambda: db.get_latest_resume(path, EMAIL)),
+        ("update_resume_analysis", lambda: db.update_resume_analysis(path, 1, "{}", 70)),
+        ("get_resume_by_id", lambda: db.get_resume_by_id(path, 1, EMAIL)),
+        ("list_resumes", lambda: db.list_resumes(path, EMAIL)),
+        ("create_habit", lambda: db.create_habit(path, EMAIL, "Read")),
+        ("list_habits", lambda: db.list_habits(path, EMAIL)),
+        ("update_habit", lambda: db.update_habit(path, 1, EMAIL, "Read more", "#000000")),
+        ("toggle_habit_log", lambda: db.toggle_habit_log(path, 1, EMAIL, "2025-01-02", 1)),
+        ("get_habit_logs", lambda: db.get_habit_logs(path, EMAIL, 2025, 1)),
+        ("get_leaderboard", lambda: db.get_leaderboard(path)),
+        ("save_chat_message", lambda: db.save_chat_message(path, EMAIL, "hello", "hi", "ctx")),
+        ("get_chat_context", lambda: db.get_chat_context(path, "0" * 64)),
+        ("get_chat_history", lambda: db.get_chat_history(path, EMAIL, include_context=True)),
+        ("get_chat_history_paginated", lambda: db.get_chat_history_paginated(path, EMAIL)),
+        ("get_chat_history_page", lambda: db.get_chat_history_page(path, EMAIL, "2030-01-01 00:00:00", 10)),
+        ("search_chat_history", lambda: db.search_chat_history(path, EMAIL, "hello")),
+        ("get_recent_chat_turns", lambda: db.get_recent_chat_turns(path, EMAIL)),
+        ("get_chat_turns_between", lambda: db.get_chat_turns_between(path, EMAIL, 0, 10)),
+        ("save_chat_memory", lambda: db.save_chat_memory(path, EMAIL, "summary", 1, 2)),
+        ("get_chat_memory", lambda: db.get_chat_memory(path, EMAIL)),
+        ("delete_chat_message", lambda: db.delete_chat_message(path, 999)),
+        ("create_resource", lambda: db.create_resource(
+            path, EMAIL, "Student", "Notes", "DBMS", "CS", "2", "2024-25", "", "n.pdf", "/tmp/n.pdf", "ab" * 32, 10)),
+        ("get_resource_by_hash", lambda: db.get_resource_by_hash(path, "ab" * 32)),
+        ("list_approved_resources", lambda: db.list_approved_resources(path, branch="CS", subject="DB")),
+        ("list_pending_resources", lambda: db.list_pending_resources(path)),
+        ("list_pending_resources_paginated", lambda: db.list_pending_resources_paginated(path)),
+        ("list_approved_resources_paginated", lambda: db.list_approved_resources_paginated(path)),
+        ("list_user_resources", lambda: db.list_user_resources(path, EMAIL)),
+        ("search_approved_resources", lambda: db.search_approved_resources(
+            path, branch="CS", year="2", after=("2030-01-01 00:00:00", 10))),
+        ("search_approved_resources", lambda: db.search_approved_resources(path, branch="CS")),
+        ("search_approved_resources", lambda: db.search_approved_resources(
+            path, query="dbms", year="2", after=(0.0, 10))),
+        ("get_resource_facets", lambda: db.get_resource_facets(path, branch="CS", year="2", subject="DBMS")),
+        ("get_resource_facets", lambda: db.get_resource_facets(path, query="dbms", branch="CS")),
+        ("get_related_resources", lambda: db.get_related_resources(path, 1)),
+        ("add_resource_stat_counts", lambda: db.add_resource_stat_counts(
+            path, {(1, "2024-01-01"): (2, 1), (999, "2024-01-01"): (1, 0)}, prune_before="2023-10-01")),
+        ("get_popular_resources", lambda: db.get_popular_resources(path, days=7)),
+        ("approve_resource", lambda: db.approve_resource(path, 1, OTHER)),
+        ("reject_resource", lambda: db.reject_resource(path, 999, OTHER)),
+        ("review_pending_resources", lambda: db.review_pending_resources(path, [998, 999], "rejected", OTHER)),
+        ("get_resource_by_id", lambda: db.get_resource_by_id(path, 1)),
+        ("get_resources_by_ids", lambda: db.get_resources_by_ids(path, [1, 999, 1])),
+        ("update_resource", lambda: db.update_resource(path, 999, EMAIL, "t", "s", "b", "1", "a", "")),
+        ("admin_update_resource_details", lambda: db.admin_update_resource_details(
+            path, 1, "Notes", "DBMS", "CS", "2", "2024-25", "")),
+        ("get_resource_stats", lambda: db.get_resource_stats(path)),
+        ("add_resource_comment", lambda: db.add_resource_comment(path, 1, OTHER, "Other", "nice")),
+        ("add_resource_comments", lambda: db.add_resource_comments(path, [1, 999], OTHER, "Other", "nice")),
+        ("get_resource_comments", lambda: db.get_resource_comments(path, 1)),
+        ("create_ai_refinement", lambda: db.create_ai_refinement(path, 1, EMAIL)),
+        ("get_ai_refinement", lambda: db.get_ai_refinement(path, 1)),
+        ("get_ai_refinement_by_resource", lambda: db.get_ai_refinement_by_resource(path, 1, EMAIL)),
+        ("update_ai_refinement", lambda: db.update_ai_refinement(path, 1, "s", "[]")),
+        ("list_user_ai_refinements", lambda: db.list_user_ai_refinements(path, EMAIL)),
+        ("admin_get_all_users", lambda: db.admin_get_all_users(path)),
+        ("admin_get_user_details", lambda: db.admin_get_user_details(path, EMAIL)),
+        ("admin_get_stats", lambda: db.admin_get_stats(path)),
+        ("get_storage_usage", lambda: db.get_storage_usage(path, email=EMAIL)),
+        ("admin_update_user", lambda: db.admin_update_user(path, OTHER, full_name="Other")),
+        ("delete_resource", lambda: db.delete_resource(path, 999, EMAIL)),
+        ("admin_delete_resource", lambda: db.admin_delete_resource(path, 999)),
+        ("delete_habit", lambda: db.delete_habit(path, 999, EMAIL)),
+        ("delete_chat_history", lambda: db.delete_chat_history(path, OTHER)),
+        ("admin_delete_user", lambda: db.admin_delete_user(path, OTHER)),
+    ]
+
+
+@pytest.fixture
+def captured(tmp_path, monkeypatch):
+    """Run the workload against a fresh database; return (db_path, [(helper, sql), ...])."""
+    app = Flask(__name__)
+    app.config["DATABASE"] = str(tmp_path / "plans.db")
+    db.init_db(app)
+    path = app.config["DATABASE"]
+
+    statements = []
+    current = {"name": None}
+    real_open = db.open_connection
+
+    def traced_open(db_path):
+        conn = real_open(db_path)
+        conn.set_trace_callback(lambda sql: statements.append((current["name"], sql)))
+        return conn
+
+    monkeypatch.setattr(db, "open_connection", traced_open)
+    for name, run in _workload(path):
+        current["name"] = name
+        run()
+    return path, statements
+
+
+def _is_planned(sql):
+    if "'main'." in sql:
+        # SQLite's own bookkeeping for FTS5 shadow tables.
+        return False
+    head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return head in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+
+
+def _full_scans(conn, sql):
+    scans = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        detail = row[3]
+        match = re.match(r"SCAN (\w+)", detail)
+        if not match or "USING" in detail or "VIRTUAL TABLE" in detail:
+            continue
+        scans.append(match.group(1))
+    return scans
+
+
+def test_every_helper_is_covered():
+    public = {
+        name for name, obj in vars(db).items()
+        if callable(obj) and not name.startswith("_")
+        and getattr(obj, "__module__", None) == db.__name__
+        and not isinstance(obj, type)
+    }
+    covered = {name for name, _ in _workload(":memory:")}
+    missing = sorted(public - covered - NOT_PLANNED)
+    assert not missing, f"add these helpers to the query-plan workload: {missing}"
+
+
+def test_no_unexpected_full_scans(captured):
+    path, statements = captured
+    assert statements, "trace callback captured no SQL"
+    conn = sqlite3.connect(path)
+    failures = []
+    for helper, sql in statements:
+        if not _is_planned(sql):
+            continue
+        for table in _full_scans(conn, sql):
+            if (helper, table) not in ALLOWED_SCANS:
+                failures.append(f"{helper}: SCAN {table}\n    {' '.join(sql.split())}")
+    conn.close()
+    assert not failures, "full table scans in hot queries:\n" + "\n".join(failures)
+
+
+def test_schema_is_fully_migrated(captured):
+    path, _ = captured
+    conn = sqlite3.connect(path)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    conn.close()
+    assert version == migrations.LATEST_VERSION
+    assert {name for name, _ in migrations.SECONDARY_INDEXES} <= names
+    assert {name for name, _ in migrations.RESOURCE_SEARCH_INDEXES} <= names
@@ -0,0 +1,79 @@
+"""
+Regression checks for the local guardrail classifier used by /chat.
+Run with: python -m pytest test_guardrail_classifier.py
+"""
+import pytest
+from flask import Flask
+
+from app import guardrail_classifier
+from app.guardrail_classifier import (
+    LABEL_ALLOWED,
+    MIN_CV_ACCURACY,
+    GuardrailClassifier,
+    cross_validate,
+    seed_examples,
+)
+
+DEFAULT_THRESHOLD = 0.9
+
+# Requests PrepPulse supports (resume review, ATS, mock tests, studying);
+# phrased differently from the seed examples on purpose.
+IN_SCOPE = [
+    "grade my resume",
+    "can you grade my cv",
+    "grade my mock test answers",
+    "grade my mock test",
+    "check my ats score for this resume",
+    "evaluate my resume for an internship",
+    "give feedback on my mock test",
+    "how are my mock test scores trending",
+    "explain how quicksort partitions an array",
+    "recommend notes for computer networks",
+]
+
+
+@pytest.fixture(scope="module")
+def seed_model():
+    return GuardrailClassifier().fit(seed_examples())
+
+
+@pytest.mark.parametrize("text", IN_SCOPE)
+def test_in_scope_requests_are_not_blocked(seed_model, text):
+    label, confidence = seed_model.classify(text)
+    assert label == LABEL_ALLOWED or confidence < DEFAULT_THRESHOLD, (label, round(confidence, 3))
+
+
+def _template_reply(model, monkeypatch, **config):
+    from app.routes import _guardrail_template_reply
+
+    monkeypatch.setattr(guardrail_classifier, "_classifier_instance", model)
+    app = Flask(__name__)
+    app.config.update(GUARDRAIL_CLASSIFIER_ENABLED=True, GUARDRAIL_CLASSIFIER_THRESHOLD=DEFAULT_THRESHOLD, **config)
+    with app.app_context():
+        return _guardrail_template_reply("is my answer correct")
+
+
+def test_untrusted_model_never_short_circuits(seed_model, monkeypatch):
+    seed_model.cv_accuracy = MIN_CV_ACCURACY - 0.01
+    assert _template_reply(seed_model, monkeypatch) is None
+    seed_model.cv_accuracy = None
+    assert _template_reply(seed_model, monkeypatch) is None
+
+
+def test_trusted_model_short_circuits(seed_model, monkeypatch):
+    seed_model.cv_accuracy = MIN_CV_ACCURACY
+    assert _template_reply(seed_model, monkeypatch) is not None
+
+
+def test_default_short_circuit_requires_min_cv_accuracy(monkeypatch):
+    # With no trained model on disk the seed model is used; it may only
+    # answer from a template by default if its measured accuracy earns it.
+    monkeypatch.setattr(guardrail_classifier, "_classifier_instance", None)
+    model = guardrail_classifier.get_guardrail_classifier("/nonexistent/guardrail_classifier.json")
+    accuracy = cross_validate(seed_examples())["accuracy"]
+    assert model.cv_accuracy == accuracy
+    reply = _template_reply(model, monkeypatch)
+    if accuracy < MIN_CV_ACCURACY:
+        assert reply is None
+    else:
+        assert reply is not None
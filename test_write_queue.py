@@ -0,0 +1,100 @@
+"""
+Tests for the group-commit writer in app/write_queue.py.
+
+Run with: python -m pytest -q test_write_queue.py
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from app import db, write_queue
+from app.write_queue import WriteQueue, WriteQueueStopped
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "queue.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _insert(conn, value):
+    conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    return value
+
+
+def _values(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT value FROM items"))
+    finally:
+        conn.close()
+
+
+def test_failing_write_is_isolated_by_savepoint(db_path):
+    # A long batch window puts all three writes in one transaction.
+    queue = WriteQueue(db_path, batch_window_ms=200).start()
+    try:
+        first = queue.submit(_insert, "a")
+        duplicate = queue.submit(_insert, "a")
+        second = queue.submit(_insert, "b")
+        assert first.result(timeout=5) == "a"
+        assert second.result(timeout=5) == "b"
+        with pytest.raises(sqlite3.IntegrityError):
+            duplicate.result(timeout=5)
+    finally:
+        queue.stop()
+    assert queue.batches == 1
+    assert _values(db_path) == ["a", "b"]
+
+
+def test_stop_flushes_pending_writes(db_path):
+    queue = WriteQueue(db_path, batch_window_ms=50, max_batch=7).start()
+    futures = [queue.submit(_insert, f"v{i}") for i in range(50)]
+    queue.stop()
+    assert not queue._thread.is_alive()
+    assert all(future.done() for future in futures)
+    assert _values(db_path) == sorted(f"v{i}" for i in range(50))
+    with pytest.raises(WriteQueueStopped):
+        queue.submit(_insert, "late")
+
+
+def test_stop_applies_items_collected_behind_stop_marker(db_path):
+    # Simulates a submit racing stop(): an item queued after _STOP in the same batch.
+    queue = WriteQueue(db_path, batch_window_ms=50)
+    first = queue.submit(_insert, "a")
+    queue._queue.put(write_queue._STOP)
+    late = queue.submit(_insert, "b")
+    queue._stopped = True
+    queue.start()
+    queue._thread.join(5)
+    assert not queue._thread.is_alive()
+    assert first.result(timeout=0) == "a"
+    assert late.result(timeout=0) == "b"
+    assert _values(db_path) == ["a", "b"]
+
+
+def test_dead_writer_fails_pending_and_helpers_write_directly(db_path, monkeypatch):
+    release = threading.Event()
+
+    def broken_open(path):
+        release.wait(5)
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(db, "open_connection", broken_open)
+    queue = WriteQueue(db_path).start()
+    pending = queue.submit(_insert, "a")
+    release.set()
+    with pytest.raises(WriteQueueStopped):
+        pending.result(timeout=5)
+    queue._thread.join(5)
+    assert not queue.is_alive()
+    monkeypatch.undo()
+
+    monkeypatch.setitem(write_queue._queues, db_path, queue)
+    assert db._queued_write(db_path, _insert, "b") == "b"
+    assert _values(db_path) == ["b"]